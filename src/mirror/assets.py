@@ -0,0 +1,336 @@
+"""Fingerprinted static assets, for long-lived browser caching.
+
+At startup, each static directory is copied to the instance's asset cache with a hash
+of each file's content in its name (like main.1a2b3c4d.css), along with compressed
+copies. Since a changed file gets a new name, the copies can be served with headers
+saying they never change, so browsers don't fetch them again after a restart.
+Scripts and stylesheets from several directories can also be bundled into one file of
+each kind, so a page needs fewer requests.
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import re
+import stat
+from collections.abc import Callable
+from pathlib import Path, PurePosixPath
+from typing import ClassVar, cast
+
+import anyio.to_thread
+from jinja2 import Environment, pass_context
+from jinja2.runtime import Context
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from mirror.sse_compression import acceptable_encodings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+_logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Types worth compressing (others, like images and WOFF fonts, are compressed already).
+_COMPRESSIBLE = {".css", ".js", ".svg", ".ttf", ".eot", ".ico", ".txt", ".html"}
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+_CSS_IMPORT = re.compile(r"@import\s[^;]+;\s*")
+
+
+class AssetPipeline:
+    """Fingerprinted copies of static asset directories.
+
+    Each directory is added under a name (the name of its static files mount, such
+    as "static" or a plugin name), and its assets are then served from
+    `/assets/<name>/`.
+    """
+
+    URL_PREFIX = "/assets"
+    BUNDLES = "bundles"
+
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = cache_dir
+        self._urls: dict[str, dict[str, str]] = {}
+
+    def add(
+        self,
+        name: str,
+        source_dir: Path,
+        replacements: dict[str, Path] | None = None,
+    ) -> None:
+        """Add a directory of assets (such as a plugin's static directory).
+
+        `replacements` has files to use in place of (or in addition to) files in the
+        directory, by path relative to it, such as subsetted fonts.
+        """
+        target_dir = self.cache_dir / name
+        build = _Build(source_dir, target_dir, replacements or {})
+        paths = {
+            path.relative_to(source_dir).as_posix()
+            for path in source_dir.rglob("*")
+            if path.is_file()
+        }
+        for path in sorted(paths | build.replacements.keys()):
+            build.fingerprint(path)
+        build.remove_stale_files()
+        self._urls[name] = {
+            path: f"{self.URL_PREFIX}/{name}/{hashed}"
+            for path, hashed in build.hashed_paths.items()
+        }
+        _logger.debug("Fingerprinted %d assets for %s", len(build.hashed_paths), name)
+
+    def bundle(self, bundles: dict[str, list[tuple[str, str]]]) -> None:
+        """Bundle added scripts and stylesheets into minified files.
+
+        `bundles` has the assets for each bundle by its filename (such as
+        "plugins.js"), as (directory name, path) pairs of assets that have been added.
+        A bundle is then available as `url(AssetPipeline.BUNDLES, filename)`, unless
+        it didn't have any assets.
+        """
+        target_dir = self.cache_dir / self.BUNDLES
+        urls = {}
+        for filename, assets in bundles.items():
+            contents = []
+            for name, path in assets:
+                url = self.url(name, path)
+                if not url:
+                    continue
+                cached = self.cache_dir / url.removeprefix(f"{self.URL_PREFIX}/")
+                content = cached.read_text()
+                if filename.endswith(".css"):
+                    content = self._absolute_css_urls(name, path, content)
+                contents.append(content)
+            if contents:
+                content = _bundle(filename, contents)
+                hashed = _store(target_dir, filename, content.encode())
+                urls[filename] = f"{self.URL_PREFIX}/{self.BUNDLES}/{hashed}"
+                _logger.debug("Bundled %d assets into %s", len(contents), hashed)
+        _remove_stale_files(
+            target_dir, {url.rpartition("/")[2] for url in urls.values()}
+        )
+        self._urls[self.BUNDLES] = urls
+
+    def _absolute_css_urls(self, name: str, path: str, content: str) -> str:
+        """Make a stylesheet's relative url() references work from a bundle."""
+        css_dir = PurePosixPath(path).parent
+
+        def replace(match: re.Match) -> str:
+            quote, url = match.groups()
+            if ":" in url or url.startswith(("/", "#")):
+                return match.group()
+            resolved = _normalize(css_dir / url)
+            if resolved is None:
+                return match.group()
+            return f"url({quote}{self.URL_PREFIX}/{name}/{resolved}{quote})"
+
+        return _CSS_URL.sub(replace, content)
+
+    def url(self, name: str, path: str) -> str | None:
+        """Get the URL of an asset's fingerprinted copy, if there is one."""
+        return self._urls.get(name, {}).get(path)
+
+    def urls(self, name: str) -> dict[str, str]:
+        """Get the URLs of the fingerprinted copies of a directory's assets by path."""
+        return self._urls.get(name, {})
+
+    def install_url_for(self, env: Environment) -> None:
+        """Make a template environment's Starlette `url_for` use fingerprinted copies.
+
+        For example, `url_for('static', path='main.css')` gives the URL of the copy of
+        main.css. Other URLs are left to Starlette.
+        """
+        starlette_url_for = cast("Callable[..., object]", env.globals["url_for"])
+
+        @pass_context
+        def url_for(context: Context, name: str, /, **path_params: str) -> object:
+            url = self.url(name, path_params.get("path", ""))
+            return url or starlette_url_for(context, name, **path_params)
+
+        env.globals["url_for"] = url_for
+
+
+class _Build:
+    """Fingerprinting of one directory."""
+
+    def __init__(
+        self, source_dir: Path, target_dir: Path, replacements: dict[str, Path]
+    ) -> None:
+        self.source_dir = source_dir
+        self.target_dir = target_dir
+        self.replacements = replacements
+        self.hashed_paths: dict[str, str] = {}
+        self._in_progress: set[str] = set()
+
+    def fingerprint(self, path: str) -> str | None:
+        """Copy an asset with a fingerprinted name, returning its relative path."""
+        if path in self.hashed_paths:
+            return self.hashed_paths[path]
+        if path in self._in_progress:
+            # A stylesheet referring back to one that refers to it can't have the
+            # other's fingerprint in it, so the reference is left as it is.
+            _logger.warning("Circular url() reference to %s", path)
+            return None
+        source = self.replacements.get(path, self.source_dir / path)
+        if not source.is_file():
+            return None
+        content = source.read_bytes()
+        if source.suffix == ".css":
+            self._in_progress.add(path)
+            try:
+                content = self._rewrite_css(path, content)
+            finally:
+                self._in_progress.discard(path)
+        hashed = _store(self.target_dir, path, content)
+        self.hashed_paths[path] = hashed
+        return hashed
+
+    def _rewrite_css(self, path: str, content: bytes) -> bytes:
+        """Point a stylesheet's url() references to fingerprinted copies."""
+        css_dir = PurePosixPath(path).parent
+
+        def replace(match: re.Match) -> str:
+            quote, url = match.groups()
+            # Keep any query or fragment (like the "?#iefix" hack for old IE).
+            reference = re.split(r"[?#]", url, maxsplit=1)[0]
+            suffix = url[len(reference) :]
+            if ":" in reference or reference.startswith("/"):
+                return match.group()  # Not a relative URL to another asset.
+            resolved = _normalize(css_dir / reference)
+            hashed = self.fingerprint(resolved) if resolved else None
+            if not hashed:
+                return match.group()
+            relative = PurePosixPath(hashed).relative_to(css_dir).as_posix()
+            if reference.startswith("./"):
+                relative = f"./{relative}"
+            return f"url({quote}{relative}{suffix}{quote})"
+
+        return _CSS_URL.sub(replace, content.decode()).encode()
+
+    def remove_stale_files(self) -> None:
+        """Remove copies of assets that have since changed."""
+        _remove_stale_files(self.target_dir, set(self.hashed_paths.values()))
+
+
+def _store(target_dir: Path, path: str, content: bytes) -> str:
+    """Write an asset with a fingerprinted name, returning its relative path."""
+    digest = hashlib.blake2b(content, digest_size=4).hexdigest()
+    pure_path = PurePosixPath(path)
+    hashed_name = f"{pure_path.stem}.{digest}{pure_path.suffix}"
+    hashed = str(pure_path.with_name(hashed_name))
+    target = target_dir / hashed
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+        if pure_path.suffix in _COMPRESSIBLE:
+            _write_compressed(target, content)
+    return hashed
+
+
+def _remove_stale_files(target_dir: Path, current: set[str]) -> None:
+    """Remove files (and their compressed copies) other than the current ones."""
+    for path in target_dir.rglob("*"):
+        if not path.is_file():
+            continue
+        relative = path.relative_to(target_dir).as_posix()
+        original = relative.removesuffix(".gz").removesuffix(".br")
+        if original not in current:
+            path.unlink()
+
+
+def _bundle(filename: str, contents: list[str]) -> str:
+    """Concatenate and minify scripts or stylesheets.
+
+    Minifying needs rjsmin (for scripts) and rcssmin (for stylesheets), from the
+    "assets" extra. Without them, the bundle is only concatenated, which still saves
+    requests, and is compressed like any other asset.
+    """
+    if filename.endswith(".css"):
+        # @import rules are ignored unless they come first.
+        imports = [
+            rule.strip() for css in contents for rule in _CSS_IMPORT.findall(css)
+        ]
+        bundle = "\n".join([*imports, *(_CSS_IMPORT.sub("", css) for css in contents)])
+        return rcssmin.cssmin(bundle) if rcssmin else bundle
+    # Separate the scripts in case one doesn't end with a semicolon.
+    bundle = "\n;\n".join(contents)
+    return rjsmin.jsmin(bundle) if rjsmin else bundle
+
+
+def _normalize(path: PurePosixPath) -> str | None:
+    """Resolve `..` and `.` in a relative path, or None if it leaves the directory."""
+    parts: list[str] = []
+    for part in path.parts:
+        if part == "..":
+            if not parts:
+                return None
+            parts.pop()
+        elif part != ".":
+            parts.append(part)
+    return "/".join(parts)
+
+
+def _write_compressed(target: Path, content: bytes) -> None:
+    gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(gzipped) < len(content):
+        target.with_name(target.name + ".gz").write_bytes(gzipped)
+    if brotli:
+        compressed = brotli.compress(content)
+        if len(compressed) < len(content):
+            target.with_name(target.name + ".br").write_bytes(compressed)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """Static files that never change, such as fingerprinted assets.
+
+    Responses say that they can be cached indefinitely, and a precompressed copy of
+    a file is sent if there is one that the browser accepts.
+    """
+
+    _SUFFIXES: ClassVar = {"br": ".br", "gzip": ".gz"}
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        response: Response | None = None
+        for encoding in acceptable_encodings(accept_encoding, self._SUFFIXES):
+            suffix = self._SUFFIXES[encoding]
+            response = await self._compressed_response(path, suffix, encoding)
+            if response:
+                break
+        if not response:
+            response = await super().get_response(path, scope)
+        if response.status_code == 200:  # noqa: PLR2004
+            response.headers["Cache-Control"] = CACHE_CONTROL
+        return response
+
+    async def _compressed_response(
+        self, path: str, suffix: str, encoding: str
+    ) -> Response | None:
+        full_path, stat_result = await anyio.to_thread.run_sync(
+            self.lookup_path, path + suffix
+        )
+        if not stat_result or not stat.S_ISREG(stat_result.st_mode):
+            return None
+        media_type, _ = mimetypes.guess_type(path)
+        return FileResponse(
+            full_path,
+            stat_result=stat_result,
+            media_type=media_type,
+            headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+        )
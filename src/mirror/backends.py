@@ -0,0 +1,175 @@
+"""Backends that decide which process runs the plugins.
+
+With a single server process, the plugins simply run in that process. When the app
+runs in several worker processes (such as under Gunicorn), running the plugins in
+every worker would multiply calls to upstream APIs by the number of workers. Instead,
+one worker runs the plugins and shares their widget updates with the others, which
+each render the updates and serve them to their own SSE clients.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import fcntl
+import json
+import logging
+import os
+from pathlib import Path
+from typing import IO, TYPE_CHECKING
+
+from mirror.serialization import ExtendedDecoder, ExtendedEncoder
+
+if TYPE_CHECKING:
+    from mirror.plugin_manager import PluginManager
+
+_logger = logging.getLogger(__name__)
+
+
+class LocalBackend:
+    """Run the plugins in this process."""
+
+    async def start(self, plugins: PluginManager) -> None:
+        plugins.startup()
+
+    async def shutdown(self, plugins: PluginManager) -> None:
+        await plugins.shutdown()
+
+    async def publish(
+        self, plugin_name: str, widget_name: str | None, data: dict
+    ) -> None:
+        """Publish a widget update to other processes, if there are any."""
+
+
+class UnixSocketBackend(LocalBackend):
+    """Share one set of running plugins between worker processes.
+
+    The first worker to lock the socket's lock file runs the plugins and publishes
+    their widget updates on a Unix socket. The other workers subscribe to the socket
+    and apply the updates to their own plugin contexts. If the publishing worker goes
+    away, a subscriber takes over.
+    """
+
+    # A subscriber that falls this far behind is disconnected (it will reconnect and
+    # get the latest updates).
+    _MAX_BUFFERED = 4 * 1024 * 1024
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._lock_file: IO | None = None
+        self._server: asyncio.Server | None = None
+        self._follower: asyncio.Task | None = None
+        self._subscribers: set[asyncio.StreamWriter] = set()
+        self._latest: dict[tuple[str, str | None], bytes] = {}
+
+    async def start(self, plugins: PluginManager) -> None:
+        if self._try_lock():
+            await self._lead(plugins)
+        else:
+            self._follower = asyncio.create_task(
+                self._follow(plugins), name="backend.follow"
+            )
+
+    async def shutdown(self, plugins: PluginManager) -> None:
+        if self._follower:
+            self._follower.cancel()
+        # This stops the plugins if this worker runs them, and either way closes the
+        # plugin contexts that updates were applied to.
+        await plugins.shutdown()
+        if self._server:
+            self._server.close()
+            for writer in self._subscribers:
+                writer.close()
+            self._path.unlink(missing_ok=True)
+        if self._lock_file:
+            self._lock_file.close()
+
+    async def publish(
+        self, plugin_name: str, widget_name: str | None, data: dict
+    ) -> None:
+        if not self._server:
+            return
+        update = {"plugin": plugin_name, "widget": widget_name, "data": data}
+        try:
+            line = json.dumps(update, cls=ExtendedEncoder).encode() + b"\n"
+        except (TypeError, ValueError):
+            # The update was applied here already; only the other workers miss it.
+            _logger.exception(
+                "Update can't be published: %s %s", plugin_name, widget_name
+            )
+            return
+        if len(line) > self._MAX_BUFFERED:
+            _logger.warning(
+                "Update too large to publish: %s %s", plugin_name, widget_name
+            )
+            return
+        self._latest[plugin_name, widget_name] = line
+        for writer in list(self._subscribers):
+            if writer.transport.get_write_buffer_size() > self._MAX_BUFFERED:
+                _logger.warning("disconnecting slow subscriber")
+                self._subscribers.discard(writer)
+                writer.close()
+                continue
+            writer.write(line)
+
+    def _try_lock(self) -> bool:
+        lock_file = self._path.with_suffix(".lock").open("a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    async def _lead(self, plugins: PluginManager) -> None:
+        _logger.info("Running plugins in this worker (pid %s)", os.getpid())
+        self._path.unlink(missing_ok=True)  # Left by a worker that crashed.
+        self._server = await asyncio.start_unix_server(self._serve, path=self._path)
+        self._path.chmod(0o600)
+        plugins.startup()
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        # Catch up the subscriber, then keep it for future updates.
+        for line in self._latest.values():
+            writer.write(line)
+        self._subscribers.add(writer)
+        try:
+            await reader.read()  # Returns when the subscriber disconnects.
+        finally:
+            self._subscribers.discard(writer)
+            writer.close()
+
+    async def _follow(self, plugins: PluginManager) -> None:
+        _logger.info("Subscribing to plugins in another worker (pid %s)", os.getpid())
+        while True:
+            with contextlib.suppress(OSError):
+                reader, writer = await asyncio.open_unix_connection(
+                    self._path, limit=self._MAX_BUFFERED
+                )
+                try:
+                    async for line in reader:
+                        await self._apply(line, plugins)
+                except ValueError:
+                    # A line over the reader's limit. Reconnecting catches up from
+                    # the latest updates.
+                    _logger.warning("Update too large, reconnecting to plugins")
+                finally:
+                    writer.close()
+            if self._try_lock():
+                await self._lead(plugins)
+                return
+            await asyncio.sleep(0.5)
+
+    @staticmethod
+    async def _apply(line: bytes, plugins: PluginManager) -> None:
+        # A bad update mustn't stop the follower, or it would miss the rest, and never
+        # take over when the leader goes away.
+        try:
+            update = json.loads(line, cls=ExtendedDecoder)
+            context = plugins.get_plugin_context(update["plugin"])
+            await context.widget_updated(update["data"], update["widget"])
+        except Exception:
+            _logger.exception("Error applying update from plugins: %r", line[:200])
@@ -0,0 +1,105 @@
+"""The mirror's configuration file, parsed once and watched for changes."""
+
+import asyncio
+import contextlib
+import inspect
+import logging
+import tomllib
+from collections.abc import Awaitable, Callable, Mapping
+from pathlib import Path
+
+from mirror.plugin import freeze_mapping
+
+_logger = logging.getLogger(__name__)
+
+Subscriber = Callable[[Mapping, Mapping], Awaitable[None] | None]
+"""Called with the old and new configuration after the file changes.
+
+A subscriber can be a coroutine function, which is awaited.
+"""
+
+
+class Config:
+    """The configuration from a TOML file (instance/mirror.toml).
+
+    The file is parsed once into an immutable snapshot, so reading the configuration
+    is free. Once started, the file is checked for changes every `poll_interval`
+    seconds, and when it has changed, the new snapshot replaces the old one and
+    subscribers are told about it, so that edits apply without a restart.
+    """
+
+    def __init__(self, path: Path, poll_interval: float = 2) -> None:
+        self.path = path
+        self._poll_interval = poll_interval
+        self._subscribers: list[Subscriber] = []
+        self._task: asyncio.Task | None = None
+        self._stat = self._read_stat()
+        self.snapshot = self._parse()
+
+    def get(self, section: str) -> Mapping:
+        """Get a section (table) of the configuration, empty if it isn't there."""
+        return self.snapshot.get(section, {})
+
+    def subscribe(self, subscriber: Subscriber) -> None:
+        """Call `subscriber` with the old and new configuration when it changes."""
+        self._subscribers.append(subscriber)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._watch(), name="config.watch")
+
+    async def shutdown(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    async def reload(self) -> bool:
+        """Reload the configuration if the file has changed since it was parsed.
+
+        Returns whether the configuration changed. If the file can't be parsed, the
+        previous configuration is kept.
+        """
+        snapshot = await asyncio.to_thread(self._reparse)
+        if snapshot is None or snapshot == self.snapshot:
+            return False
+        old, self.snapshot = self.snapshot, snapshot
+        _logger.info("Configuration changed: %s", self.path)
+        for subscriber in self._subscribers:
+            try:
+                result = subscriber(old, snapshot)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                _logger.exception("Error applying configuration change.")
+        return True
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self._poll_interval)
+            await self.reload()
+
+    def _reparse(self) -> Mapping | None:
+        stat = self._read_stat()
+        if stat == self._stat:
+            return None
+        self._stat = stat
+        try:
+            return self._parse()
+        except tomllib.TOMLDecodeError as ex:
+            _logger.error("Ignoring invalid configuration in %s: %s", self.path, ex)  # noqa: TRY400
+            return None
+
+    def _read_stat(self) -> tuple[int, int] | None:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _parse(self) -> Mapping:
+        try:
+            with self.path.open(mode="rb") as f:
+                return freeze_mapping(tomllib.load(f))
+        except FileNotFoundError:
+            _logger.warning("Configuration file not found: %s", self.path)
+            return freeze_mapping({})
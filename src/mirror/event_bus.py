@@ -1,14 +1,26 @@
 """Event support."""
 
+import asyncio
+import hashlib
+import json
 import logging
-from asyncio import Queue
-from collections.abc import AsyncGenerator
-from dataclasses import dataclass
+import time
+from collections import Counter, OrderedDict, deque
+from collections.abc import AsyncGenerator, Hashable, Iterable
+from dataclasses import dataclass, field
+from enum import StrEnum
+from functools import cached_property
+from itertools import count
 
-_TERMINATE_SENTINEL = "__exit__"
+from sse_starlette import ServerSentEvent
+
+from mirror import metrics
 
 _logger = logging.getLogger(__name__)
 
+# Sent when there are no events to keep the connection alive and detect dead clients.
+_HEARTBEAT = ServerSentEvent(comment="heartbeat").encode()
+
 
 @dataclass
 class Event:
@@ -17,65 +29,483 @@ class Event:
     name: str
     data: str
 
-    def as_sse_dict(self) -> dict:
-        """Get the event as a dict for SSE."""
-        return {
-            "event": self.name,
-            "data": self.data,
+    # Assigned by the bus when the event is posted; sent as the SSE id.
+    seq: int = field(default=0, init=False, compare=False)
+
+    # When making the event started (such as before its widget was rendered), by
+    # time.monotonic(); by default, when the event was created.
+    started: float = field(default_factory=time.monotonic, compare=False, repr=False)
+
+    # Assigned by the bus when patches are enabled and one is smaller than the event.
+    patch: "Patch | None" = field(default=None, init=False, compare=False, repr=False)
+
+    @property
+    def widget(self) -> str:
+        """The widget the event is for, from the event name (e.g. "weather")."""
+        return self.name.partition(".")[0]
+
+    @cached_property
+    def digest(self) -> str:
+        """A short hash of the event's content, computed once."""
+        return content_digest(self.name, self.data)
+
+    @cached_property
+    def wire(self) -> bytes:
+        """The event encoded as an SSE message.
+
+        The message is encoded only once, and the same bytes are sent to every
+        listener. Multi-line data is split into multiple `data:` lines.
+        """
+        return ServerSentEvent(
+            data=self.data, event=self.name, id=str(self.seq)
+        ).encode()
+
+
+def content_digest(name: str, data: str) -> str:
+    """Get a short hash of an event's content, such as for an ETag."""
+    content = hashlib.blake2b(name.encode(), digest_size=8)
+    content.update(b"\0")
+    content.update(data.encode())
+    return content.hexdigest()
+
+
+@dataclass(frozen=True)
+class Patch:
+    """A change to a widget's HTML, relative to an earlier event for the widget.
+
+    The patch is sent as a `<widget>.patch` event with JSON data for the client-side
+    applier (static/sse-patch.js). Offsets and lengths are in UTF-16 code units, as
+    JavaScript counts them.
+    """
+
+    base_seq: int
+    wire: bytes
+
+    @classmethod
+    def create(cls, base: Event, event: Event) -> "Patch":
+        old, new = base.data, event.data
+        prefix = _common_prefix_length(old, new)
+        suffix = _common_prefix_length(old[prefix:][::-1], new[prefix:][::-1])
+        data = {
+            "start": _utf16_length(new[:prefix]),
+            "end": _utf16_length(new[len(new) - suffix :]),
+            "text": new[prefix : len(new) - suffix],
+            "length": _utf16_length(new),
         }
+        wire = ServerSentEvent(
+            data=json.dumps(data, separators=(",", ":")),
+            event=f"{event.widget}.patch",
+            id=str(event.seq),
+        ).encode()
+        return cls(base_seq=base.seq, wire=wire)
+
+
+def _common_prefix_length(a: str, b: str) -> int:
+    # Binary search so that the comparisons are done by (fast) slice equality.
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def _utf16_length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+class OverflowPolicy(StrEnum):
+    """How a listener's mailbox handles events that the client hasn't taken yet."""
+
+    # A newer event replaces an unsent event of the same name; if the mailbox is
+    # still full, the oldest event is dropped.
+    COALESCE = "coalesce"
+
+    # Every event is kept in order; the oldest event is dropped when full.
+    DROP_OLDEST = "drop-oldest"
+
+    # Every event is kept in order; the client is disconnected when full.
+    DISCONNECT = "disconnect"
+
+
+class _BusMetrics:
+    """Metrics recorded by the event bus."""
+
+    def __init__(self) -> None:
+        self.posted = metrics.Counter(
+            "mirror_events_posted_total", "Events posted to the bus.", "event"
+        )
+        self.deduplicated = metrics.Counter(
+            "mirror_events_deduplicated_total",
+            "Posted events not sent because nothing changed.",
+            "event",
+        )
+        self.delivered = metrics.Counter(
+            "mirror_events_delivered_total", "Events sent to listeners.", "event"
+        )
+        self.coalesced = metrics.Counter(
+            "mirror_events_coalesced_total",
+            "Unsent events replaced by a newer event of the same name.",
+            "event",
+        )
+        self.dropped = metrics.Counter(
+            "mirror_events_dropped_total",
+            "Unsent events dropped because a listener fell behind.",
+            "event",
+        )
+        self.post_seconds = metrics.Histogram(
+            "mirror_event_post_seconds", "Time taken to post an event to the bus."
+        )
+        self.delivery_seconds = metrics.Histogram(
+            "mirror_event_delivery_seconds",
+            "Time from starting to render an event to sending it to a listener.",
+        )
+        self.listeners = metrics.Gauge("mirror_listeners", "Connected listeners.")
+        self.queue_depth = metrics.Gauge(
+            "mirror_listener_queue_depth",
+            "Events waiting to be sent to a listener.",
+            "listener",
+        )
+        self.queue_high_water = metrics.Gauge(
+            "mirror_listener_queue_high_water",
+            "The most events ever waiting to be sent to a listener.",
+            "listener",
+        )
+
+    def expose(self, listeners: list["_Listener"]) -> str:
+        self.listeners.set(len(listeners))
+        self.queue_depth.clear()
+        self.queue_high_water.clear()
+        for listener in listeners:
+            self.queue_depth.set(listener.depth, str(listener.id))
+            self.queue_high_water.set(listener.high_water, str(listener.id))
+        return metrics.expose(list(vars(self).values()))
+
+
+class _Listener:
+    """A bounded mailbox of events waiting to be sent to one client.
+
+    Putting an event never blocks, so a slow client can't hold up the producer.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        listener_id: int,
+        *,
+        policy: OverflowPolicy,
+        maxsize: int,
+        full_refresh_interval: int,
+        bus_metrics: _BusMetrics,
+        widgets: set[str] | None,
+    ) -> None:
+        self.id = listener_id
+        self.widgets = widgets
+        self._policy = policy
+        self._maxsize = maxsize
+        self._full_refresh_interval = full_refresh_interval
+        self._metrics = bus_metrics
+        self._pending: OrderedDict[Hashable, Event] = OrderedDict()
+        self._ready = asyncio.Event()
+        self._keys = count()
+        self._delivered: dict[str, int] = {}
+        self._patch_counts: Counter[str] = Counter()
+        self.closed = False
+        self.coalesced = 0
+        self.dropped = 0
+        self.high_water = 0
+        self.last_active = time.monotonic()
+
+    @property
+    def depth(self) -> int:
+        """The number of events waiting to be sent."""
+        return len(self._pending)
+
+    def put(self, event: Event) -> None:
+        if self.closed:
+            return
+
+        if self._policy is OverflowPolicy.COALESCE:
+            key: Hashable = event.name
+            if self._pending.pop(key, None) is not None:
+                self.coalesced += 1
+                self._metrics.coalesced.inc(event.name)
+        else:
+            key = next(self._keys)
+
+        if len(self._pending) >= self._maxsize:
+            if self._policy is OverflowPolicy.DISCONNECT:
+                _logger.warning("disconnecting slow listener")
+                for dropped in (*self._pending.values(), event):
+                    self._drop(dropped)
+                self._pending.clear()
+                self.close()
+                return
+            _, dropped = self._pending.popitem(last=False)
+            self._drop(dropped)
+
+        self._pending[key] = event
+        self.high_water = max(self.high_water, len(self._pending))
+        self._ready.set()
+
+    def _drop(self, event: Event) -> None:
+        self.dropped += 1
+        self._metrics.dropped.inc(event.name)
+
+    async def get(self) -> Event | None:
+        """Wait for the next event, or None once the listener is closed."""
+        while not self._pending:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        if self.closed:
+            return None
+        _, event = self._pending.popitem(last=False)
+        return event
+
+    def close(self) -> None:
+        self.closed = True
+        self._pending.clear()
+        self._ready.set()
+
+    def encode(self, event: Event) -> bytes:
+        """Get the message to send for an event.
+
+        The event's patch is sent if the client already has the patch's base, unless
+        it is time for a periodic full refresh.
+        """
+        base_seq = self._delivered.get(event.name)
+        self._delivered[event.name] = event.seq
+        if (
+            event.patch is not None
+            and event.patch.base_seq == base_seq
+            and self._patch_counts[event.name] < self._full_refresh_interval
+        ):
+            self._patch_counts[event.name] += 1
+            return event.patch.wire
+        self._patch_counts[event.name] = 0
+        return event.wire
 
 
 class EventBus:
     """Bus for posting events and streaming them to listeners."""
 
-    def __init__(self) -> None:
-        """Initialize the event bus."""
-        self._listener_queues: list[Queue] = []
+    def __init__(  # noqa: PLR0913
+        self,
+        overflow_policy: OverflowPolicy = OverflowPolicy.COALESCE,
+        maxsize: int = 50,
+        replay_size: int = 100,
+        *,
+        patches: bool = False,
+        full_refresh_interval: int = 20,
+        heartbeat_interval: float = 15,
+        idle_timeout: float = 60,
+    ) -> None:
+        """Initialize the event bus.
+
+        `overflow_policy` and `maxsize` control each listener's mailbox of events that
+        haven't been sent to the client yet.
+
+        `replay_size` is how many recent events are kept for clients that reconnect.
+
+        If `patches` is true, an event is sent as a patch against the client's copy of
+        the previous event with the same name, when that is smaller. A full event is
+        still sent after `full_refresh_interval` patches in a row.
+
+        A heartbeat is sent to a listener after `heartbeat_interval` seconds without
+        events. A listener whose client hasn't taken an event or heartbeat for
+        `idle_timeout` seconds is assumed to be dead and is removed.
+        """
+        self._overflow_policy = overflow_policy
+        self._maxsize = maxsize
+        self._patches = patches
+        self._full_refresh_interval = full_refresh_interval
+        self._heartbeat_interval = heartbeat_interval
+        self._idle_timeout = idle_timeout
+        self._reaper: asyncio.Task | None = None
+        self._listeners: list[_Listener] = []
+        self._unfiltered_listeners: set[_Listener] = set()
+        self._listeners_by_widget: dict[str, set[_Listener]] = {}
         self._cached_events: dict[str, Event] = {}
+        self._replay_log: deque[Event] = deque(maxlen=replay_size)
+        self._listener_ids = count(1)
+        self._metrics = _BusMetrics()
+
+        # Event ids start from the current time so that they keep increasing across
+        # server restarts, and a client's id from before a restart is always older
+        # than the replay log.
+        self._seq = count(time.time_ns() // 1000)
+
+    def start(self) -> None:
+        """Start the event bus's background work."""
+        self._reaper = asyncio.create_task(
+            self._reap_idle_listeners(), name="event_bus.reaper"
+        )
 
     async def shutdown(self) -> None:
         """Shutdown the event bus."""
-        for queue in self._listener_queues:
-            _logger.info("queuing terminate sentinel")
-            await queue.put(_TERMINATE_SENTINEL)
+        if self._reaper:
+            self._reaper.cancel()
+        for listener in self._listeners:
+            _logger.info("closing listener")
+            listener.close()
+
+    def metrics_text(self) -> str:
+        """Get the bus's metrics in the Prometheus text format."""
+        return self._metrics.expose(self._listeners)
 
     async def post(self, event: Event) -> None:
         """Post an event to the bus.
 
-        If the event is the same as the last event posted (not including data['_time'])
+        If the event has the same digest as the last event posted with the same name
         then it will not be sent to clients.
+
+        Posting never waits on listeners; see `OverflowPolicy` for what happens when a
+        listener falls behind.
         """
         _logger.debug("Event posted: %s", event)
+        start = time.perf_counter()
+        self._metrics.posted.inc(event.name)
+        self._post(event)
+        self._metrics.post_seconds.observe(time.perf_counter() - start)
 
+    def _post(self, event: Event) -> None:
         # Don't send if there's nothing new.
         cached = self._cached_events.get(event.name)
-        if cached == event:
+        if cached is not None and cached.digest == event.digest:
+            self._metrics.deduplicated.inc(event.name)
             return
 
-        # Cache the most recent event.
+        # Cache the most recent event, and log it for clients that reconnect.
+        event.seq = next(self._seq)
         self._cached_events[event.name] = event
+        self._replay_log.append(event)
+
+        # Encode once, up front, rather than per listener. Likewise for a patch
+        # against the previous event, if it's smaller.
+        wire = event.wire
+        if self._patches and cached is not None:
+            patch = Patch.create(cached, event)
+            if len(patch.wire) < len(wire):
+                event.patch = patch
 
-        # Post to each active queue.
-        for queue in self._listener_queues:
-            await queue.put(event)
+        # Post to each active listener that wants this widget's events.
+        for listener in self._unfiltered_listeners:
+            listener.put(event)
+        for listener in self._listeners_by_widget.get(event.widget, ()):
+            listener.put(event)
 
-    async def listen_for_events(self) -> AsyncGenerator:
-        """Yield events (as dicts) from the bus."""
-        queue: Queue = Queue(maxsize=50)
+    async def listen_for_events(
+        self,
+        last_event_id: str | None = None,
+        widgets: Iterable[str] | None = None,
+    ) -> AsyncGenerator:
+        """Yield events (as encoded SSE messages) from the bus.
 
-        # Queue the most recent events.
-        for event in self._cached_events.values():
-            await queue.put(event)
+        `last_event_id` is the id of the last event a reconnecting client received.
+        If it is still in the replay log, only the events after it are sent.
+        Otherwise, the most recent event of each name is sent.
+
+        `widgets` limits the events to those for the given widgets (such as
+        "weather" or "calendars-agenda"). By default, all events are sent.
+        """
+        subscribed = set(widgets) if widgets is not None else None
+
+        # What the client missed. If that is more than the mailbox holds, the overflow
+        # policy would apply before the client got anything (and with "disconnect",
+        # again on every reconnect), so the client gets a snapshot instead.
+        missed = self._filter(self._missed_events(last_event_id), subscribed)
+        if len(missed) > self._maxsize:
+            missed = self._filter(self._cached_events.values(), subscribed)
+
+        listener = _Listener(
+            next(self._listener_ids),
+            policy=self._overflow_policy,
+            # Big enough for the snapshot, which has one event per widget, so that
+            # none of the widgets is left stale.
+            maxsize=max(self._maxsize, len(missed)),
+            full_refresh_interval=self._full_refresh_interval,
+            bus_metrics=self._metrics,
+            widgets=subscribed,
+        )
+        for missed_event in missed:
+            listener.put(missed_event)
 
         # Subscribe to future events.
-        self._listener_queues.append(queue)
+        self._subscribe(listener)
 
         try:
             while True:
-                event = await queue.get()
-                if event == _TERMINATE_SENTINEL:
+                try:
+                    async with asyncio.timeout(self._heartbeat_interval):
+                        event = await listener.get()
+                except TimeoutError:
+                    yield _HEARTBEAT
+                    listener.last_active = time.monotonic()
+                    continue
+                if event is None:
                     _logger.info("terminating event generator")
                     return
-                yield event.as_sse_dict()
+                yield listener.encode(event)
+                listener.last_active = time.monotonic()
+                self._metrics.delivered.inc(event.name)
+                self._metrics.delivery_seconds.observe(time.monotonic() - event.started)
         finally:
-            self._listener_queues.remove(queue)
+            self._unsubscribe(listener)
+            _logger.info(
+                "listener removed; coalesced: %s, dropped: %s",
+                listener.coalesced,
+                listener.dropped,
+            )
+
+    def _subscribe(self, listener: _Listener) -> None:
+        self._listeners.append(listener)
+        if listener.widgets is None:
+            self._unfiltered_listeners.add(listener)
+            return
+        for widget in listener.widgets:
+            self._listeners_by_widget.setdefault(widget, set()).add(listener)
+
+    def _unsubscribe(self, listener: _Listener) -> None:
+        if listener not in self._listeners:
+            return  # Already reaped.
+        self._listeners.remove(listener)
+        if listener.widgets is None:
+            self._unfiltered_listeners.discard(listener)
+            return
+        for widget in listener.widgets:
+            subscribers = self._listeners_by_widget[widget]
+            subscribers.discard(listener)
+            if not subscribers:
+                del self._listeners_by_widget[widget]
+
+    async def _reap_idle_listeners(self) -> None:
+        while True:
+            await asyncio.sleep(self._heartbeat_interval)
+            deadline = time.monotonic() - self._idle_timeout
+            for listener in list(self._listeners):
+                if listener.last_active < deadline:
+                    _logger.warning("removing idle listener %s", listener.id)
+                    listener.close()
+                    self._unsubscribe(listener)
+
+    @staticmethod
+    def _filter(events: Iterable[Event], widgets: set[str] | None) -> list[Event]:
+        """Get the events for the given widgets (or all of them, if None)."""
+        return [event for event in events if widgets is None or event.widget in widgets]
+
+    def _missed_events(self, last_event_id: str | None) -> list[Event]:
+        """Get the events a client needs to catch up.
+
+        A new client, or one too far behind the replay log, gets a full snapshot.
+        """
+        try:
+            last_seq = int(last_event_id or "")
+        except ValueError:
+            last_seq = None
+        log = self._replay_log
+        if last_seq is None or not log or not log[0].seq - 1 <= last_seq <= log[-1].seq:
+            return list(self._cached_events.values())
+        return [event for event in log if event.seq > last_seq]
@@ -0,0 +1,197 @@
+"""Subsetting of bundled web fonts.
+
+The bundled fonts are TrueType files with every glyph of the font, most of which the
+mirror never shows. This finds the font faces that the stylesheets and templates
+actually use, and makes WOFF2 copies of them with only Latin glyphs, along with a
+stylesheet that uses the copies. It needs the fontTools and brotli packages, from the
+"assets" extra.
+"""
+
+import hashlib
+import importlib.util
+import logging
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+
+_logger = logging.getLogger(__name__)
+
+# Latin glyphs (as in Google Fonts' "latin" subset), enough for English and
+# Portuguese.
+LATIN_UNICODE_RANGE = (
+    "U+0000-00FF, U+0131, U+0152-0153, U+02BB-02BC, U+02C6, U+02DA, U+02DC, "
+    "U+0304, U+0308, U+0329, U+2000-206F, U+20AC, U+2122, U+2191, U+2193, U+2212, "
+    "U+2215, U+FEFF, U+FFFD"
+)
+
+_FONT_FACE = re.compile(r"@font-face\s*\{([^}]*)\}")
+_DECLARATION = re.compile(r"([\w-]+)\s*:\s*([^;}]+)")
+_CSS_URL = re.compile(r"""url\(\s*['"]?([^'")?#]+)""")
+_BOLD_TAGS = re.compile(r"<(b|strong|th|h[1-6])\b", re.IGNORECASE)
+_ITALIC_TAGS = re.compile(r"<(i|em)\b", re.IGNORECASE)
+_WEIGHTS = {"normal": 400, "bold": 700}
+
+
+@dataclass(frozen=True)
+class FontUsage:
+    """The font families, weights and styles that are used."""
+
+    families: frozenset[str]
+    weights: frozenset[int]
+    styles: frozenset[str]
+
+
+@dataclass(frozen=True)
+class _FontFace:
+    family: str
+    weight: int
+    style: str
+    source: str
+
+
+def find_usage(stylesheets: Iterable[str], templates: Iterable[str]) -> FontUsage:
+    """Find the fonts used by stylesheets and (via tags like <b>) templates."""
+    families = set()
+    weights = {400}
+    styles = {"normal"}
+    for css in stylesheets:
+        for name, raw_value in _DECLARATION.findall(_FONT_FACE.sub("", css)):
+            value = raw_value.strip()
+            if name == "font-family":
+                families.add(_unquote(value.split(",")[0]))
+            elif name == "font-weight":
+                weights.add(_parse_weight(value))
+            elif name == "font-style":
+                styles.add(value)
+    for html in templates:
+        if _BOLD_TAGS.search(html):
+            weights.add(700)
+        if _ITALIC_TAGS.search(html):
+            styles.add("italic")
+    return FontUsage(frozenset(families), frozenset(weights), frozenset(styles))
+
+
+def subset_fonts(
+    static_dir: Path, usage: FontUsage, cache_dir: Path
+) -> dict[str, Path]:
+    """Make subsetted WOFF2 copies of the used font faces in a static directory.
+
+    Returns the files to use in place of (or in addition to) the static directory's
+    own, by path relative to it: new stylesheets for the fonts, and the WOFF2 files
+    they refer to.
+    """
+    if not all(map(importlib.util.find_spec, ("fontTools", "brotli"))):
+        _logger.warning("Install the assets extra to subset fonts.")
+        return {}
+
+    replacements = {}
+    for css_path in sorted(static_dir.rglob("*.css")):
+        faces = _parse_font_faces(css_path.read_text())
+        used = _used_faces(faces, usage)
+        if not used:
+            continue
+        css_relative = PurePosixPath(css_path.relative_to(static_dir).as_posix())
+        rules = []
+        for face in used:
+            source = css_path.parent / face.source
+            woff2_name = f"{source.stem}.latin.woff2"
+            woff2_relative = str(css_relative.parent / woff2_name)
+            replacements[woff2_relative] = _subset(source, cache_dir / woff2_relative)
+            rules.append(_font_face_rule(face, woff2_name))
+        subset_css = cache_dir / css_relative
+        subset_css.write_text("\n\n".join(rules) + "\n")
+        replacements[str(css_relative)] = subset_css
+        _logger.info("Subsetted %d of %d faces in %s", len(used), len(faces), css_path)
+    return replacements
+
+
+def _parse_font_faces(css: str) -> list[_FontFace]:
+    faces = []
+    for block in _FONT_FACE.findall(css):
+        declarations = {
+            name: value.strip() for name, value in _DECLARATION.findall(block)
+        }
+        source = _CSS_URL.search(declarations.get("src", ""))
+        if not source or "font-family" not in declarations:
+            continue
+        faces.append(
+            _FontFace(
+                family=_unquote(declarations["font-family"]),
+                weight=_parse_weight(declarations.get("font-weight", "normal")),
+                style=declarations.get("font-style", "normal"),
+                source=source.group(1),
+            )
+        )
+    return faces
+
+
+def _used_faces(faces: list[_FontFace], usage: FontUsage) -> list[_FontFace]:
+    """Find the faces the browser would pick for the used weights and styles."""
+    used = []
+    for style in sorted(usage.styles):
+        candidates = [
+            face
+            for face in faces
+            if face.family in usage.families and face.style == style
+        ]
+        for weight in sorted(usage.weights):
+            if candidates:
+                nearest = min(candidates, key=lambda face: abs(face.weight - weight))
+                if nearest not in used:
+                    used.append(nearest)
+    return used
+
+
+def _subset(source: Path, target: Path) -> Path:
+    from fontTools import subset  # noqa: PLC0415
+
+    # The target is named for its source's content, so it's only made once.
+    target = target.with_suffix(f".{_digest(source)}.woff2")
+    if target.exists():
+        return target
+    target.parent.mkdir(parents=True, exist_ok=True)
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    font = subset.load_font(str(source), options)
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=_parse_unicode_range(LATIN_UNICODE_RANGE))
+    subsetter.subset(font)
+    subset.save_font(font, str(target), options)
+    return target
+
+
+def _font_face_rule(face: _FontFace, woff2_name: str) -> str:
+    return "\n".join(
+        [
+            "@font-face {",
+            f"    font-family: '{face.family}';",
+            f"    src: url('{woff2_name}') format('woff2');",
+            f"    font-weight: {face.weight};",
+            f"    font-style: {face.style};",
+            "    font-display: swap;",
+            f"    unicode-range: {LATIN_UNICODE_RANGE};",
+            "}",
+        ]
+    )
+
+
+def _parse_unicode_range(unicode_range: str) -> list[int]:
+    code_points: list[int] = []
+    for part in unicode_range.split(","):
+        first, _, last = part.strip().removeprefix("U+").partition("-")
+        code_points.extend(range(int(first, 16), int(last or first, 16) + 1))
+    return code_points
+
+
+def _parse_weight(value: str) -> int:
+    return _WEIGHTS.get(value, int(value) if value.isdigit() else 400)
+
+
+def _unquote(value: str) -> str:
+    return value.strip().strip("'\"")
+
+
+def _digest(path: Path) -> str:
+    return hashlib.blake2b(path.read_bytes(), digest_size=4).hexdigest()
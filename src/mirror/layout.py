@@ -1,11 +1,8 @@
 """Layout configuration for the mirror."""
 
 import logging
-import tomllib
-from collections.abc import Iterable
-from pathlib import Path
+from collections.abc import Iterable, Mapping
 
-from mirror.plugin import Plugin
 from mirror.plugin_manager import PluginManager
 
 _logger = logging.getLogger(__name__)
@@ -14,13 +11,7 @@ _logger = logging.getLogger(__name__)
 class Layout:
     """Layout configuration for the mirror."""
 
-    def __init__(self, config_file: Path, plugins: PluginManager) -> None:
-        try:
-            with config_file.open(mode="rb") as f:
-                config = tomllib.load(f)
-        except FileNotFoundError:
-            _logger.warning("Layout configuration file not found: %s", config_file)
-            config = {}
+    def __init__(self, config: Mapping, plugins: PluginManager) -> None:
         layout = config.get("layout", {})
         left = layout.get("left", [])
         right = layout.get("right", [])
@@ -28,21 +19,16 @@ class Layout:
         self.left = self._valid_widgets(left, plugins)
         self.right = self._valid_widgets(right, plugins)
         self.bottom = self._valid_widgets(bottom, plugins)
+        # Seconds to show each bottom widget.
+        self.rotation_interval = layout.get("rotation_interval", 30)
         # TODO: If there are no widgets, use a default layout.
 
     @staticmethod
-    def _valid_widgets(
-        widgets: list[str],
-        plugins: Iterable[Plugin],
-    ) -> list[str]:
+    def _valid_widgets(widgets: Iterable[str], plugins: PluginManager) -> list[str]:
         valid_widgets = []
         for widget in widgets:
-            plugin_name, _, _widget_name = widget.partition("-")
-            for plugin in plugins:
-                if plugin.name == plugin_name:
-                    # TODO: Check if _widget_name is valid for plugin (template exists?)
-                    valid_widgets.append(widget)
-                    break
+            if plugins.has_widget(widget):
+                valid_widgets.append(widget)
             else:
-                _logger.warning("Ignoring widget for unknown plugin: %s", plugin_name)
+                _logger.warning("Ignoring unknown widget: %s", widget)
         return valid_widgets
@@ -1,31 +1,73 @@
 """The main entry point for the backend server."""
 
 import contextlib
+import ipaddress
 import logging
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Iterable, Iterator, Mapping
+from pathlib import Path
 
+from jinja2 import TemplateNotFound
 from sse_starlette.sse import EventSourceResponse
 from starlette.applications import Starlette
 from starlette.requests import Request
-from starlette.responses import Response
+from starlette.responses import HTMLResponse, Response, StreamingResponse
 from starlette.routing import Mount, Route
 from starlette.staticfiles import StaticFiles
 from starlette.templating import Jinja2Templates
 
+from mirror import fonts
+from mirror.assets import AssetPipeline, ImmutableStaticFiles
+from mirror.backends import LocalBackend, UnixSocketBackend
+from mirror.config import Config
 from mirror.diagnostics import log_task_stacks
 from mirror.errors import AuthError
-from mirror.event_bus import EventBus
+from mirror.event_bus import EventBus, OverflowPolicy, content_digest
 from mirror.layout import Layout
+from mirror.metrics import CONTENT_TYPE
 from mirror.paths import INSTANCE_DIR, ROOT_DIR
-from mirror.plugin_manager import PluginManager
-from mirror.rotator import render_rotator_widget
+from mirror.plugin_manager import PluginManager, PluginNotFoundError
+from mirror.renderer import Renderer
+from mirror.rotator import Rotator
+from mirror.sse_compression import CompressedEventSourceResponse, choose_encoding
+from mirror.template_cache import precompile
 
 _logger = logging.getLogger(__name__)
 
 
 async def stream_events(request: Request) -> EventSourceResponse:
-    event_bus = request.app.state.event_bus
-    return EventSourceResponse(event_bus.listen_for_events())
+    state = request.app.state
+    last_event_id = request.headers.get("last-event-id")
+    widgets_param = request.query_params.get("widgets")
+    widgets = widgets_param.split(",") if widgets_param is not None else None
+    events = state.event_bus.listen_for_events(last_event_id, widgets)
+    if state.compress_events:
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+        if encoding:
+            return CompressedEventSourceResponse(
+                events, encoding=encoding, **state.sse_options
+            )
+    return EventSourceResponse(events, **state.sse_options)
+
+
+async def widget(request: Request) -> Response:
+    """Get a widget's current HTML, such as for a client that can't apply a patch."""
+    widget_name = request.path_params["widget"]
+    if widget_name == "rotator":
+        # Not a plugin's widget, but it's patched like one (see mirror.rotator).
+        html = request.app.state.rotator.html
+    else:
+        try:
+            html = request.app.state.plugins.render_widget(widget_name)
+        except (ValueError, TemplateNotFound):
+            return Response(status_code=404, content=f"Widget not found: {widget_name}")
+    # The digest the event bus uses to skip unchanged updates, so that a browser
+    # revalidating its copy is told when it already has the current HTML.
+    etag = f'"{content_digest(f"{widget_name}.refresh", html)}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(html, headers=headers)
 
 
 async def diagnostics(request: Request) -> Response:  # noqa: ARG001
@@ -33,14 +75,39 @@ async def diagnostics(request: Request) -> Response:  # noqa: ARG001
     return Response(status_code=204)
 
 
+async def metrics(request: Request) -> Response:
+    return Response(request.app.state.event_bus.metrics_text(), media_type=CONTENT_TYPE)
+
+
 async def ready(request: Request) -> Response:  # noqa: ARG001
     return Response()
 
 
-async def rotator(request: Request) -> Response:
-    app = request.app
-    context = build_template_context(request)
-    return app.state.templates.TemplateResponse(request, "rotator.html", context)
+async def reload_plugin(request: Request) -> Response:
+    """Reload a plugin's code and templates, such as after editing them.
+
+    There is no authentication, so only requests from this machine are accepted.
+    """
+    if not _is_loopback(request):
+        return Response(status_code=403)
+    plugin_name = request.path_params["plugin"]
+    try:
+        await request.app.state.plugins.reload_plugin(plugin_name)
+    except PluginNotFoundError:
+        return Response(status_code=404, content=f"Plugin not found: {plugin_name}")
+    except Exception as e:
+        _logger.exception("Error reloading plugin: %s", plugin_name)
+        return Response(status_code=500, content=f"Error reloading plugin. {e}")
+    return Response(status_code=204)
+
+
+def _is_loopback(request: Request) -> bool:
+    if request.client is None:
+        return False
+    try:
+        return ipaddress.ip_address(request.client.host).is_loopback
+    except ValueError:
+        return False
 
 
 async def oauth_redirect(request: Request) -> Response:
@@ -51,9 +118,10 @@ async def oauth_redirect(request: Request) -> Response:
     """
     plugin_name = request.path_params.get("plugin")
     plugins = request.app.state.plugins
-    plugin = next((p for p in plugins if p.name == plugin_name), None)
-    if not plugin:
-        _logger.error("OAuth redirect plugin not found: %s", plugin_name)
+    try:
+        plugin = plugins.get_plugin(plugin_name)
+    except PluginNotFoundError:
+        _logger.error("OAuth redirect plugin not found: %s", plugin_name)  # noqa: TRY400
         return Response(status_code=404, content=f"Plugin not found: {plugin_name}")
 
     code = request.query_params.get("code")
@@ -82,10 +150,43 @@ async def oauth_redirect(request: Request) -> Response:
 
 async def index(request: Request) -> Response:
     app = request.app
-    context = build_template_context(request)
+    layout = app.state.layout
+    plugins = app.state.plugins
+    widgets = [*layout.left, *layout.right, "connectivity"]
+    if app.state.stream_index:
+        # The template is rendered on a worker thread as the response streams, so
+        # the head goes out first, while the widgets render on the renderer's
+        # workers (if any), and then each section goes out once its widgets have
+        # rendered.
+        rendered = plugins.start_rendering_widgets(widgets)
+        context = build_template_context(request, {"rendered": rendered})
+        template = app.state.templates.get_template("index.html")
+        return StreamingResponse(
+            _flush_at_sections(template.generate(context)), media_type="text/html"
+        )
+    # Render the widgets before the template, on the renderer's workers if it has
+    # any (rather than on the event loop).
+    rendered = await plugins.render_widgets(widgets)
+    context = build_template_context(request, {"rendered": rendered})
     return app.state.templates.TemplateResponse(request, "index.html", context)
 
 
+def _flush_at_sections(chunks: Iterable[str]) -> Iterator[str]:
+    """Group the many small chunks of a template into the page's sections.
+
+    The head goes out as soon as it's rendered, so the browser can start loading
+    scripts and stylesheets, and then each section of widgets as it is rendered.
+    """
+    buffer: list[str] = []
+    for chunk in chunks:
+        buffer.append(chunk)
+        if "</head>" in chunk or "</section>" in chunk:
+            yield "".join(buffer)
+            buffer.clear()
+    if buffer:
+        yield "".join(buffer)
+
+
 def build_template_context(request: Request, extra: dict | None = None) -> dict:
     extra = extra or {}
     app = request.app
@@ -101,21 +202,91 @@ def build_template_context(request: Request, extra: dict | None = None) -> dict:
 @contextlib.asynccontextmanager
 async def lifespan(app: Starlette) -> AsyncGenerator:
     # Before serving any requests:
-    app.state.plugins.startup()
+    plugins = app.state.plugins
+    app.state.event_bus.start()
+    await plugins.backend.start(plugins)
+    app.state.rotator.start()
+    app.state.config.start()
     try:
         yield
     finally:
-        # After the server is signaled to shutdown and connections are closed. Need to
-        # rethink this because connections are not closed when SSE is connected.
-        app.state.plugins.shutdown()
+        # After the server is signaled to shutdown and connections are closed. SSE
+        # connections are closed by sse-starlette when it sees the signal, and the
+        # server's graceful shutdown timeout bounds how long any others can take.
+        await app.state.config.shutdown()
+        await app.state.rotator.shutdown()
+        await plugins.backend.shutdown(plugins)
+        plugins.renderer.shutdown()
         await app.state.event_bus.shutdown()
 
 
+def create_backend(server_config: Mapping) -> LocalBackend:
+    backend = server_config.get("backend", "local")
+    if backend == "local":
+        return LocalBackend()
+    if backend == "unix":
+        socket = server_config.get("socket", INSTANCE_DIR / "mirror.sock")
+        return UnixSocketBackend(Path(socket))
+    msg = f"Unknown server backend: {backend}"
+    raise ValueError(msg)
+
+
+def create_assets(
+    assets_config: Mapping, static_dir: Path, plugins: PluginManager
+) -> AssetPipeline:
+    replacements = {}
+    if assets_config.get("subset_fonts", False):
+        static_dirs = [static_dir, *(p.static_path for p in plugins if p.static_path)]
+        template_dirs = [ROOT_DIR / "templates", *(p.path for p in plugins)]
+        usage = fonts.find_usage(
+            stylesheets=[
+                path.read_text() for d in static_dirs for path in d.rglob("*.css")
+            ],
+            templates=[
+                path.read_text() for d in template_dirs for path in d.glob("*.html")
+            ],
+        )
+        replacements = fonts.subset_fonts(
+            static_dir, usage, INSTANCE_DIR / "font-cache"
+        )
+    assets = AssetPipeline(INSTANCE_DIR / "asset-cache")
+    assets.add("static", static_dir, replacements)
+    for plugin in plugins:
+        if plugin.static_path:
+            assets.add(plugin.name, plugin.static_path)
+            plugin.static_urls = assets.urls(plugin.name)
+    if assets_config.get("bundle", False):
+        assets.bundle(
+            {
+                "plugins.js": [(p.name, path) for p in plugins for path in p.scripts],
+                "plugins.css": [
+                    (p.name, path) for p in plugins for path in p.stylesheets
+                ],
+            }
+        )
+    return assets
+
+
 def create_app() -> Starlette:
-    event_bus = EventBus()
-    config_file = INSTANCE_DIR / "mirror.toml"
-    plugins = PluginManager(event_bus, config_file)
-    layout = Layout(config_file, plugins)
+    config = Config(INSTANCE_DIR / "mirror.toml")
+    events_config = config.get("events")
+    event_bus = EventBus(
+        overflow_policy=OverflowPolicy(
+            events_config.get("overflow_policy", OverflowPolicy.COALESCE)
+        ),
+        maxsize=events_config.get("queue_size", 50),
+        replay_size=events_config.get("replay_size", 100),
+        patches=events_config.get("patches", False),
+        full_refresh_interval=events_config.get("full_refresh_interval", 20),
+        heartbeat_interval=events_config.get("heartbeat_interval", 15),
+        idle_timeout=events_config.get("idle_timeout", 60),
+    )
+    backend = create_backend(config.get("server"))
+    templates_config = config.get("templates")
+    renderer = Renderer(templates_config.get("render_workers", 0))
+    plugins = PluginManager(event_bus, config, backend, renderer)
+    layout = Layout(config.snapshot, plugins)
+    rotator = Rotator(plugins, event_bus, layout.bottom, layout.rotation_interval)
 
     static_dir = ROOT_DIR / "static"
     template_dir = [ROOT_DIR / "templates"]
@@ -133,22 +304,71 @@ def create_app() -> Starlette:
     routes = [
         Route("/ready", endpoint=ready),
         Route("/oauth/{plugin}", endpoint=oauth_redirect),
-        Route("/rotator", endpoint=rotator),
         Route("/events", endpoint=stream_events),
+        Route("/widgets/{widget}", endpoint=widget),
         Route("/diag", endpoint=diagnostics),
+        Route("/metrics", endpoint=metrics),
         Mount("/static", StaticFiles(directory=static_dir, html=True), name="static"),
         Route("/", endpoint=index),
         *plugin_static_mounts,
     ]
+    if config.get("server").get("admin", False):
+        routes.append(
+            Route(
+                "/admin/plugins/{plugin}/reload",
+                endpoint=reload_plugin,
+                methods=["POST"],
+            )
+        )
+    assets = None
+    assets_config = config.get("assets")
+    if assets_config.get("fingerprint", False):
+        assets = create_assets(assets_config, static_dir, plugins)
+        routes.append(
+            Mount(
+                AssetPipeline.URL_PREFIX,
+                ImmutableStaticFiles(directory=assets.cache_dir),
+                name="assets",
+            )
+        )
 
     application = Starlette(debug=True, routes=routes, lifespan=lifespan)
     state = application.state
     state.layout = layout
     state.templates = Jinja2Templates(directory=template_dir)
     state.templates.env.globals["render_widget"] = plugins.render_widget
-    state.templates.env.globals["render_rotator_widget"] = render_rotator_widget
+    state.templates.env.globals["rotator"] = rotator
+    # Plugin script and stylesheet bundles, if any, by filename.
+    state.templates.env.globals["bundles"] = {}
+    if assets:
+        assets.install_url_for(state.templates.env)
+        state.templates.env.globals["bundles"] = assets.urls(AssetPipeline.BUNDLES)
     state.event_bus = event_bus
+    state.compress_events = events_config.get("compress", False)
+    state.sse_options = {
+        # The event bus sends its own heartbeats. (0 disables the library's pings
+        # as of sse-starlette 3.5; before that, it pinged in a busy loop.)
+        "ping": 0,
+        # Give up on a client that doesn't take an event in time.
+        "send_timeout": events_config.get("send_timeout", 30),
+    }
     state.plugins = plugins
+    state.rotator = rotator
+    state.config = config
+    state.stream_index = templates_config.get("stream_index", False)
+
+    if templates_config.get("precompile", False):
+        cache_dir = INSTANCE_DIR / "template-cache"
+        precompile(state.templates.env, cache_dir / "mirror")
+        plugins.precompile_templates(cache_dir / "plugins")
+
+    def layout_changed(old: Mapping, new: Mapping) -> None:
+        # The new layout applies to pages loaded from now on, and to the rotation.
+        if old.get("layout") != new.get("layout"):
+            state.layout = Layout(new, plugins)
+            rotator.update(state.layout.bottom, state.layout.rotation_interval)
+
+    config.subscribe(layout_changed)
 
     return application
 
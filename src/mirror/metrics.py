@@ -0,0 +1,139 @@
+"""Simple metrics, exposed in the Prometheus text format.
+
+Each metric has at most one label, which keeps things simple and is all the mirror
+needs. See https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Iterator
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label: str = "") -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+
+    def expose(self) -> Iterator[str]:
+        """Generate the lines of text for the metric."""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type_name}"
+
+    def _labels(self, label_value: str, **extra: str) -> str:
+        labels = {self.label: label_value} if self.label else {}
+        labels.update(extra)
+        if not labels:
+            return ""
+        pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+        return f"{{{pairs}}}"
+
+
+class Counter(_Metric):
+    """A count that only goes up."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label: str = "") -> None:
+        super().__init__(name, documentation, label)
+        self._values: defaultdict[str, float] = defaultdict(float)
+
+    def inc(self, label_value: str = "", amount: float = 1) -> None:
+        self._values[label_value] += amount
+
+    def expose(self) -> Iterator[str]:
+        yield from super().expose()
+        for label_value, value in sorted(self._values.items()):
+            yield f"{self.name}{self._labels(label_value)} {_format(value)}"
+
+
+class Gauge(_Metric):
+    """A value that can go up and down."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, label: str = "") -> None:
+        super().__init__(name, documentation, label)
+        self._values: dict[str, float] = {}
+
+    def set(self, value: float, label_value: str = "") -> None:
+        self._values[label_value] = value
+
+    def clear(self) -> None:
+        self._values.clear()
+
+    def expose(self) -> Iterator[str]:
+        yield from super().expose()
+        for label_value, value in sorted(self._values.items()):
+            yield f"{self.name}{self._labels(label_value)} {_format(value)}"
+
+
+class Histogram(_Metric):
+    """A distribution of observed values (such as latencies in seconds)."""
+
+    type_name = "histogram"
+
+    DEFAULT_BUCKETS = (
+        0.0005,
+        0.001,
+        0.0025,
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+    )
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label: str = "",
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, label)
+        self._buckets = buckets
+        self._counts: dict[str, list[int]] = {}
+        self._sums: defaultdict[str, float] = defaultdict(float)
+
+    def observe(self, value: float, label_value: str = "") -> None:
+        counts = self._counts.setdefault(label_value, [0] * (len(self._buckets) + 1))
+        counts[bisect_left(self._buckets, value)] += 1
+        self._sums[label_value] += value
+
+    def expose(self) -> Iterator[str]:
+        yield from super().expose()
+        for label_value, counts in sorted(self._counts.items()):
+            cumulative = 0
+            # Bounds are written as floats ("1.0", not "1"), as Prometheus does.
+            bounds = [*(repr(float(bucket)) for bucket in self._buckets), "+Inf"]
+            for bound, count in zip(bounds, counts, strict=True):
+                cumulative += count
+                labels = self._labels(label_value, le=bound)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = self._labels(label_value)
+            yield f"{self.name}_sum{labels} {_format(self._sums[label_value])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+def expose(metrics: list[_Metric]) -> str:
+    """Get the text exposition of some metrics."""
+    lines = [line for metric in metrics for line in metric.expose()]
+    return "\n".join(lines) + "\n"
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
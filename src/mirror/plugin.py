@@ -2,16 +2,22 @@
 
 from __future__ import annotations
 
-import copy
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
 from pathlib import Path
-from typing import TYPE_CHECKING
+from threading import Lock
+from types import MappingProxyType
+from typing import TYPE_CHECKING, cast
 
 if TYPE_CHECKING:
     from types import ModuleType
 
     from mirror.plugin_context import PluginContext
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemLoader, Template
+
+from mirror import template_cache
 
 
 class Plugin:
@@ -21,17 +27,35 @@ class Plugin:
     instantiated automatically when a plugin is discovered.
     """
 
+    # Number of rendered widgets (for different widgets or values of n) to keep.
+    RENDER_CACHE_SIZE = 16
+
     def __init__(self, name: str, module: ModuleType) -> None:
         """Initialize the plugin."""
         self.name = name
         self.module = module
 
         # Set up the template rendering environment.
-        self.widget_contexts: dict[str, dict] = {}
+        self.widget_contexts: dict[str, Mapping] = {}
+        self._renders: OrderedDict[tuple[str, int | None], _Render] = OrderedDict()
+        # Whether each widget has content, and the context that was determined for.
+        self._has_content: dict[str, tuple[Mapping, bool]] = {}
+        # Widgets may be rendered on worker threads (see mirror.renderer).
+        self._renders_lock = Lock()
+
+        # The plugin's widget template names (without the .html extension), and its
+        # script and stylesheet filenames, relative to its static directory. These
+        # are found once, rather than on every page render.
+        self.widgets = sorted(p.stem for p in self.path.glob("*.html"))
+        self.scripts = self._find_static_files("*.js")
+        self.stylesheets = self._find_static_files("*.css")
+
+        # Fingerprinted URLs of static assets, if any (see mirror.assets).
+        self.static_urls: dict[str, str] = {}
 
         def url_for(filename: str) -> str:
             """Generate a URL for a plugin's static asset."""
-            return f"/plugin/{self.name}/{filename}"
+            return self.static_urls.get(filename) or f"/plugin/{self.name}/{filename}"
 
         # Note: leaving autoescape=False (the default) so that the widget() macro can
         # return HTML markup (otherwise it will be escaped). Thus ignoring S701.
@@ -43,6 +67,10 @@ class Plugin:
     def __str__(self) -> str:
         return self.name
 
+    def precompile_templates(self, cache_dir: Path) -> None:
+        """Compile the plugin's widget templates ahead of their first render."""
+        template_cache.precompile(self.env, cache_dir / self.name)
+
     async def set_authorization_code(
         self,
         plugin_context: PluginContext,
@@ -77,7 +105,11 @@ class Plugin:
 
         `context` is passed to the widget template. If `context` is None, the context
         from the previous call to `render()` is used. If there is no previous context,
-        an empty context is used.
+        an empty context is used. A new context is kept as an immutable snapshot, so it
+        is copied once when it is given rather than each time it is rendered, and parts
+        of it that haven't changed since the previous context are shared with that
+        one's snapshot rather than copied again.
+        Rendering the same snapshot with the same `n` again returns the cached HTML.
 
         `widget` is the name of the widget to render. If `widget` is not specified, the
         plugin's main template (<plugin_name>.html) is rendered.
@@ -86,15 +118,52 @@ class Plugin:
         widgets that need to maintain state across multiple renderings.
         """
         widget = widget or self.name
-        if context is None:
-            context = self.widget_contexts.get(widget, {})
-        context["n"] = n
-        self.widget_contexts[widget] = copy.deepcopy(context)
+        snapshot = None
+        if context is not None:
+            snapshot = freeze_mapping(context, self.widget_contexts.get(widget))
         template_name = f"{widget}.html"
         template = self.env.get_template(template_name)
-        rendered_widget = template.render(**context)
+
+        key = (widget, n)
+        with self._renders_lock:
+            if snapshot is None:
+                snapshot = self.widget_contexts.get(widget, _EMPTY_CONTEXT)
+            else:
+                self.widget_contexts[widget] = snapshot
+                self._forget_renders(widget)
+            cached = self._renders.get(key)
+            # The template is compared too, in case it was reloaded after a change.
+            if cached and cached.context is snapshot and cached.template is template:
+                self._renders.move_to_end(key)
+                return cached.html
+
+        rendered_widget = template.render(snapshot, n=n)
+        with self._renders_lock:
+            # Don't cache over a newer context stored while rendering.
+            if self.widget_contexts.get(widget, _EMPTY_CONTEXT) is snapshot:
+                self._has_content[widget] = (snapshot, bool(rendered_widget.strip()))
+                self._renders[key] = _Render(snapshot, template, rendered_widget)
+                if len(self._renders) > self.RENDER_CACHE_SIZE:
+                    self._renders.popitem(last=False)
         return rendered_widget
 
+    def has_content(self, widget: str | None) -> bool | None:
+        """Whether a widget has anything to display.
+
+        This is found when the widget is rendered with its latest context (such as
+        when the plugin updates it), so it's None if that hasn't happened yet. It's
+        assumed that whether a widget has content doesn't depend on `n`.
+        """
+        widget = widget or self.name
+        with self._renders_lock:
+            snapshot, has_content = self._has_content.get(widget, (None, None))
+            current = self.widget_contexts.get(widget, _EMPTY_CONTEXT)
+        return has_content if snapshot is current else None
+
+    def _forget_renders(self, widget: str) -> None:
+        for key in [key for key in self._renders if key[0] == widget]:
+            del self._renders[key]
+
     @property
     def path(self) -> Path:
         """The plugin's root directory."""
@@ -109,22 +178,72 @@ class Plugin:
         p = self.path / "static"
         return p if p.exists() else None
 
-    @property
-    def scripts(self) -> list[str]:
-        """The plugin's script filenames.
-
-        The filenames are relative to the plugin's static directory.
-        """
+    def _find_static_files(self, pattern: str) -> list[str]:
         if not self.static_path:
             return []
-        return [p.name for p in self.static_path.glob("*.js")]
+        return sorted(p.name for p in self.static_path.glob(pattern))
 
-    @property
-    def stylesheets(self) -> list[str]:
-        """The plugin's stylesheet filenames.
 
-        The filenames are relative to the plugin's static directory.
-        """
-        if not self.static_path:
-            return []
-        return [p.name for p in self.static_path.glob("*.css")]
+@dataclass(frozen=True)
+class _Render:
+    """A rendered widget, cached along with what it was rendered from."""
+
+    context: Mapping
+    template: Template
+    html: str
+
+
+_EMPTY_CONTEXT: Mapping = MappingProxyType({})
+
+
+def freeze_mapping(mapping: Mapping, previous: Mapping | None = None) -> Mapping:
+    """Get an immutable snapshot of data, such as template context data.
+
+    Mappings become read-only mappings, lists become tuples and sets become frozen
+    sets, so that the data's owner (such as a plugin) can go on changing it without
+    changing the snapshot. Other objects (such as datetimes) are kept as they are, so
+    they shouldn't be changed once they're in the data.
+
+    Parts of the data equal to those of `previous`, an earlier snapshot, are taken
+    from it rather than kept as new copies (and if all of the data is equal,
+    `previous` itself is returned), so snapshots of data that changes a little at a
+    time share most of their memory.
+    """
+    return cast("Mapping", _freeze(mapping, previous))
+
+
+def _freeze(value: object, previous: object) -> object:
+    if isinstance(value, Mapping):
+        old = previous if isinstance(previous, MappingProxyType) else _EMPTY_CONTEXT
+        frozen = {key: _freeze(item, old.get(key)) for key, item in value.items()}
+        if (
+            old is previous
+            and frozen.keys() == old.keys()
+            and all(_same(frozen[key], old[key]) for key in frozen)
+        ):
+            return previous
+        return MappingProxyType(frozen)
+    if isinstance(value, list | tuple):
+        old_items = previous if isinstance(previous, tuple) else ()
+        items = tuple(
+            _freeze(item, old_items[i] if i < len(old_items) else None)
+            for i, item in enumerate(value)
+        )
+        if (
+            old_items is previous
+            and len(items) == len(old_items)
+            and all(map(_same, items, old_items))
+        ):
+            return previous
+        return items
+    if isinstance(value, set | frozenset):
+        members = frozenset(value)
+        return previous if members == previous else members
+    return value
+
+
+def _same(frozen: object, previous: object) -> bool:
+    # Containers equal to their previous snapshot were replaced by it.
+    if isinstance(frozen, MappingProxyType | tuple | frozenset):
+        return frozen is previous
+    return type(frozen) is type(previous) and frozen == previous
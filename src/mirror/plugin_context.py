@@ -1,15 +1,25 @@
 """Context given to plugins."""
 
+from __future__ import annotations
+
 import json
 import logging
-from datetime import datetime
+import time
+from typing import TYPE_CHECKING
 
 from cryptography.fernet import Fernet
 from sqlitedict import SqliteDict
 
 from mirror.event_bus import Event, EventBus
 from mirror.paths import INSTANCE_DIR
-from mirror.plugin import Plugin
+from mirror.renderer import Renderer
+from mirror.serialization import ExtendedDecoder, ExtendedEncoder
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from mirror.backends import LocalBackend
+    from mirror.plugin import Plugin
 
 _logger = logging.getLogger(__name__)
 
@@ -21,10 +31,19 @@ class PluginContext:
     themselves.
     """
 
-    def __init__(self, plugin: Plugin, event_bus: EventBus, config: dict) -> None:
+    def __init__(
+        self,
+        plugin: Plugin,
+        event_bus: EventBus,
+        config: Mapping,
+        backend: LocalBackend | None = None,
+        renderer: Renderer | None = None,
+    ) -> None:
         """Initialize the plugin context."""
         self._plugin = plugin
         self._event_bus = event_bus
+        self._backend = backend
+        self._renderer = renderer or Renderer()
         self.config = config.get("plugin", {}).get(plugin.name, {})
         self.db = PluginDatabase(plugin.name)
 
@@ -41,9 +60,17 @@ class PluginContext:
             event_name += f"-{widget_name}"
         event_name += ".refresh"
 
-        html = self._plugin.render(context=data, widget=widget_name)
+        async with self._renderer.in_order(event_name):
+            started = time.monotonic()
+            html = await self._renderer.render(self._plugin, data, widget_name)
+            event = Event(name=event_name, data=html, started=started)
+            await self._event_bus.post(event)
+        if self._backend:
+            await self._backend.publish(self._plugin.name, widget_name, data)
 
-        await self._event_bus.post(Event(name=event_name, data=html))
+    def close(self) -> None:
+        """Close the plugin's database, once the plugin has stopped."""
+        self.db.close()
 
     _connectivity_score = 0
 
@@ -114,34 +141,7 @@ class PluginDatabase(SqliteDict):
             _logger.debug("Existing database key used at %s", key_path.absolute())
 
     def _encrypted_json_encoder(self, obj: object) -> bytes:
-        return self._fernet.encrypt(json.dumps(obj, cls=_ExtendedEncoder).encode())
+        return self._fernet.encrypt(json.dumps(obj, cls=ExtendedEncoder).encode())
 
     def _encrypted_json_decoder(self, data: bytes) -> object:
-        return json.loads(self._fernet.decrypt(data), cls=_ExtendedDecoder)
-
-
-class _ExtendedEncoder(json.JSONEncoder):
-    """JSON encoder that handles additional object types."""
-
-    def default(self, o: object) -> object:
-        if hasattr(o, "isoformat"):
-            return {"_dt_": o.isoformat()}
-
-        return json.JSONEncoder.default(self, o)
-
-
-class _ExtendedDecoder(json.JSONDecoder):
-    """JSON decoder that handles additional object types."""
-
-    def __init__(self, *args, **kwargs) -> None:
-        kwargs["object_hook"] = self._object_hook
-        super().__init__(*args, **kwargs)
-
-    @staticmethod
-    def _object_hook(obj: dict) -> object:
-        if "_dt_" in obj:
-            try:
-                return datetime.fromisoformat(obj["_dt_"])
-            except ValueError:
-                pass
-        return obj
+        return json.loads(self._fernet.decrypt(data), cls=ExtendedDecoder)
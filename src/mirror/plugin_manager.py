@@ -1,13 +1,20 @@
 """Plugin management module."""
 
+import asyncio
+import importlib
 import logging
-import tomllib
-from collections.abc import Iterator
+import sys
+from collections.abc import Iterable, Iterator, Mapping
+from concurrent.futures import Future
 from pathlib import Path
 
+from mirror.backends import LocalBackend
+from mirror.config import Config
 from mirror.event_bus import EventBus
+from mirror.plugin import Plugin
 from mirror.plugin_context import PluginContext
 from mirror.plugin_discovery import discover_plugins
+from mirror.renderer import Renderer
 
 _logger = logging.getLogger(__name__)
 
@@ -22,59 +29,261 @@ class PluginNotFoundError(Exception):
 class PluginManager:
     """Class for working with all discovered plugins."""
 
-    def __init__(self, event_bus: EventBus, config_file: Path) -> None:
+    # Seconds to wait for a stopped plugin's tasks to finish.
+    STOP_TIMEOUT = 5
+
+    def __init__(
+        self,
+        event_bus: EventBus,
+        config: Config,
+        backend: LocalBackend | None = None,
+        renderer: Renderer | None = None,
+    ) -> None:
         self._event_bus = event_bus
-        self._config_file = config_file
-        self._discovered_plugins = discover_plugins()
-        _logger.info(
-            "Discovered plugins: %s",
-            ", ".join(plugin.name for plugin in self._discovered_plugins),
-        )
+        self._config = config
+        # Whether the plugins are running in this process (see mirror.backends).
+        self._started = False
+        # Each plugin's context, created when it's first needed. A plugin gets a new
+        # one when it's restarted, so that it sees any new configuration.
+        self._contexts: dict[str, PluginContext] = {}
+        # The tasks each running plugin started (such as to refresh its data).
+        self._tasks: dict[str, set[asyncio.Task]] = {}
+        self.backend = backend or LocalBackend()
+        self.renderer = renderer or Renderer()
+        # The discovered plugins by name, and their widgets by widget name (such as
+        # "clock" or "calendars-agenda"), along with each widget's template name.
+        self._plugins: dict[str, Plugin] = {}
+        self._widgets: dict[str, tuple[Plugin, str]] = {}
+        for plugin in discover_plugins():
+            self._register(plugin)
+        _logger.info("Discovered plugins: %s", ", ".join(self._plugins))
+        config.subscribe(self._config_changed)
 
     def __iter__(self) -> Iterator:
         """Iterate over the discovered plugins."""
-        yield from self._discovered_plugins
+        yield from self._plugins.values()
+
+    def _register(self, plugin: Plugin) -> None:
+        """Add a plugin (or replace one with the same name) and index its widgets."""
+        self._plugins[plugin.name] = plugin
+        for widget_name, (widget_plugin, _) in list(self._widgets.items()):
+            if widget_plugin.name == plugin.name:
+                del self._widgets[widget_name]
+        for template in plugin.widgets:
+            widget_name = (
+                plugin.name if template == plugin.name else f"{plugin.name}-{template}"
+            )
+            self._widgets[widget_name] = (plugin, template)
 
     def startup(self) -> None:
         """Start all discovered plugins."""
-        for plugin in self._discovered_plugins:
+        self._started = True
+        for plugin in self:
+            self._start_plugin(plugin)
+
+    async def shutdown(self) -> None:
+        """Stop all discovered plugins (if they were started) and close their contexts.
+
+        This is also for a process that only renders updates from plugins running in
+        another process, since that uses their contexts too.
+        """
+        if self._started:
+            await asyncio.gather(*(self._stop_plugin(plugin) for plugin in self))
+        self._started = False
+        for plugin_name in list(self._contexts):
+            self._close_context(plugin_name)
+
+    def _start_plugin(self, plugin: Plugin) -> None:
+        before = _running_tasks()
+        try:
+            plugin.startup(self.get_plugin_context(plugin.name))
+        except Exception as ex:  # noqa: BLE001
+            _logger.error(  # noqa: TRY400
+                "Error from plugin '%s' (start_plugin): %s",
+                plugin.name,
+                ex,
+            )
+        # Starting is synchronous, so any new tasks are the plugin's.
+        self._tasks[plugin.name] = _running_tasks() - before
+
+    async def _stop_plugin(self, plugin: Plugin) -> None:
+        try:
+            plugin.shutdown(self.get_plugin_context(plugin.name))
+        except Exception as ex:  # noqa: BLE001
+            _logger.error(  # noqa: TRY400
+                "Error from plugin '%s' (stop_plugin): %s",
+                plugin.name,
+                ex,
+            )
+        # Plugins cancel their tasks when stopped, but a cancelled task can still be
+        # using the plugin's database until it has finished, so wait for them before
+        # closing it. Any a plugin left running are cancelled too.
+        tasks = self._tasks.pop(plugin.name, set())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.STOP_TIMEOUT)
+            if pending:
+                _logger.warning("Plugin '%s' didn't stop in time", plugin.name)
+                self._contexts.pop(plugin.name, None)  # Left open for its tasks.
+                return
+        self._close_context(plugin.name)
+
+    def _close_context(self, plugin_name: str) -> None:
+        context = self._contexts.pop(plugin_name, None)
+        if context:
             try:
-                plugin.startup(self.get_plugin_context(plugin.name))
-            except Exception as ex:  # noqa: BLE001
-                _logger.error(  # noqa: TRY400
-                    "Error from plugin '%s' (start_plugin): %s",
-                    plugin.name,
-                    ex,
-                )
+                context.close()
+            except Exception:
+                _logger.exception("Error closing context of plugin: %s", plugin_name)
 
-    def shutdown(self) -> None:
-        """Stop all discovered plugins."""
-        for plugin in self._discovered_plugins:
+    async def _config_changed(self, old: Mapping, new: Mapping) -> None:
+        """Restart the plugins whose configuration changed, if they're running."""
+        if not self._started:
+            return
+        old_plugins, new_plugins = old.get("plugin", {}), new.get("plugin", {})
+        for plugin in self:
+            if old_plugins.get(plugin.name) != new_plugins.get(plugin.name):
+                _logger.info("Restarting plugin for new configuration: %s", plugin)
+                await self._stop_plugin(plugin)
+                self._start_plugin(plugin)
+
+    def precompile_templates(self, cache_dir: Path) -> None:
+        """Compile all discovered plugins' widget templates."""
+        for plugin in self:
             try:
-                plugin.shutdown(self.get_plugin_context(plugin.name))
+                plugin.precompile_templates(cache_dir)
             except Exception as ex:  # noqa: BLE001
                 _logger.error(  # noqa: TRY400
-                    "Error from plugin '%s' (stop_plugin): %s",
+                    "Error from plugin '%s' (precompile_templates): %s",
                     plugin.name,
                     ex,
                 )
 
+    async def reload_plugin(self, plugin_name: str) -> None:
+        """Stop a plugin, import its package again, and start it again.
+
+        This picks up changes to the plugin's code and templates without restarting
+        the server, and the other plugins keep running. The plugin's widgets keep
+        their latest contexts, so they render as before (with any changed templates)
+        until the reloaded plugin updates them. If the package can't be imported, the
+        plugin is started again as it was, and the error is raised.
+        """
+        plugin = self.get_plugin(plugin_name)
+        if self._started:
+            await self._stop_plugin(plugin)
+        package = plugin.module.__name__
+        modules = {
+            name: module
+            for name, module in sys.modules.items()
+            if name == package or name.startswith(f"{package}.")
+        }
+        for name in modules:
+            del sys.modules[name]
+        importlib.invalidate_caches()
+        try:
+            reloaded = Plugin(plugin.name, importlib.import_module(package))
+        except Exception:
+            sys.modules.update(modules)
+            if self._started:
+                self._start_plugin(plugin)
+            raise
+        reloaded.widget_contexts.update(plugin.widget_contexts)
+        reloaded.static_urls = plugin.static_urls
+        self._register(reloaded)
+        if self._started:
+            self._start_plugin(reloaded)
+        _logger.info("Reloaded plugin: %s", plugin_name)
+
     def get_plugin_context(self, plugin_name: str) -> PluginContext:
         """Get the PluginContext for a specific plugin by name."""
-        plugin = next(
-            (p for p in self._discovered_plugins if p.name == plugin_name),
-            None,
-        )
+        context = self._contexts.get(plugin_name)
+        if not context:
+            plugin = self.get_plugin(plugin_name)
+            context = PluginContext(
+                plugin,
+                self._event_bus,
+                self._config.snapshot,
+                self.backend,
+                self.renderer,
+            )
+            self._contexts[plugin_name] = context
+        return context
+
+    def get_plugin(self, plugin_name: str) -> Plugin:
+        """Get a plugin by name."""
+        plugin = self._plugins.get(plugin_name)
         if not plugin:
             raise PluginNotFoundError(plugin_name)
-        with self._config_file.open(mode="rb") as f:
-            config = tomllib.load(f)
-        return PluginContext(plugin, self._event_bus, config)
+        return plugin
+
+    def has_widget(self, widget_name: str) -> bool:
+        """Whether a widget (such as "clock" or "calendars-agenda") exists."""
+        return widget_name in self._widgets
+
+    def widget_has_content(self, widget_name: str) -> bool | None:
+        """Whether a widget has anything to display (see `Plugin.has_content`)."""
+        if widget_name not in self._widgets:
+            return None
+        plugin, template = self._widgets[widget_name]
+        return plugin.has_content(template)
 
     def render_widget(self, widget_name: str, n: int | None = None) -> str:
-        plugin_name, _, widget_name = widget_name.partition("-")
-        for plugin in self._discovered_plugins:
-            if plugin.name == plugin_name:
-                return plugin.render(context=None, widget=widget_name, n=n)
-        msg = f"Unknown plugin: {plugin_name}"
-        raise ValueError(msg)
+        if widget_name not in self._widgets:
+            msg = f"Unknown widget: {widget_name}"
+            raise ValueError(msg)
+        plugin, template = self._widgets[widget_name]
+        return plugin.render(context=None, widget=template, n=n)
+
+    async def render_widgets(self, widget_names: Iterable[str]) -> dict[str, str]:
+        """Render several widgets at once, on the renderer's workers if it has any.
+
+        Returns the HTML for each widget by name.
+        """
+        widget_names = list(widget_names)
+        renders = [
+            self.renderer.call(self.render_widget, name) for name in widget_names
+        ]
+        return dict(zip(widget_names, await asyncio.gather(*renders), strict=True))
+
+    def start_rendering_widgets(self, widget_names: Iterable[str]) -> Mapping[str, str]:
+        """Start rendering several widgets on the renderer's workers, if it has any.
+
+        This is for a template rendered off the event loop (such as a streamed
+        response's, which is rendered on a worker thread). Returns the HTML for each
+        widget that was started by name, where getting it waits for its render to
+        finish. With no workers, none are started, so the template renders each
+        widget itself when it gets to it.
+        """
+        renders = {}
+        for name in widget_names:
+            render = self.renderer.submit(self.render_widget, name)
+            if render:
+                renders[name] = render
+        return _PendingRenders(renders)
+
+
+class _PendingRenders(Mapping[str, str]):
+    """Widgets' HTML, from renders that may still be running."""
+
+    def __init__(self, renders: dict[str, Future[str]]) -> None:
+        self._renders = renders
+
+    def __getitem__(self, widget_name: str) -> str:
+        return self._renders[widget_name].result()
+
+    def __contains__(self, widget_name: object) -> bool:
+        return widget_name in self._renders
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._renders)
+
+    def __len__(self) -> int:
+        return len(self._renders)
+
+
+def _running_tasks() -> set[asyncio.Task]:
+    try:
+        return asyncio.all_tasks()
+    except RuntimeError:  # Not on an event loop, so there aren't any.
+        return set()
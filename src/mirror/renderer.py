@@ -0,0 +1,73 @@
+"""Rendering of widget templates, optionally off the event loop."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, TypeVar
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Callable
+
+    from mirror.plugin import Plugin
+
+T = TypeVar("T")
+
+
+class Renderer:
+    """Renders widgets, either on the event loop or on a pool of worker threads.
+
+    With no workers (the default), widgets are rendered on the event loop, which is
+    fine for small templates. With workers, a large template doesn't hold up the loop
+    (and so everything else the server is doing) while it renders.
+
+    Threads rather than processes are used because templates and their contexts
+    would otherwise have to be pickled, which costs about as much as rendering.
+    """
+
+    def __init__(self, workers: int = 0) -> None:
+        self._executor = (
+            ThreadPoolExecutor(workers, thread_name_prefix="render")
+            if workers
+            else None
+        )
+        self._locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    async def render(
+        self,
+        plugin: Plugin,
+        context: dict | None,
+        widget: str | None,
+        n: int | None = None,
+    ) -> str:
+        """Render a plugin's widget template (see `Plugin.render`)."""
+        return await self.call(plugin.render, context, widget, n)
+
+    async def call(self, func: Callable[..., T], *args: object) -> T:
+        """Call a rendering function, on a worker if there are any."""
+        if not self._executor:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def submit(self, func: Callable[..., T], *args: object) -> Future[T] | None:
+        """Start a rendering function on a worker, or None if there aren't any."""
+        if not self._executor:
+            return None
+        return self._executor.submit(func, *args)
+
+    @contextlib.asynccontextmanager
+    async def in_order(self, key: str) -> AsyncIterator[None]:
+        """Run a block for `key` only after earlier blocks for `key` have finished.
+
+        Waiters go in the order they arrived, so updates to a widget that are
+        rendered and posted within the block are posted in the order they were made.
+        """
+        async with self._locks[key]:
+            yield
+
+    def shutdown(self) -> None:
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,36 +1,126 @@
-"""Rotator helper functions."""
+"""Rotation through a list of widgets, such as the layout's bottom widgets."""
 
+import asyncio
+import contextlib
+import logging
+from dataclasses import dataclass
+
+from mirror.event_bus import Event, EventBus
 from mirror.plugin_manager import PluginManager
 
+_logger = logging.getLogger(__name__)
+
+NO_CONTENT = "<!-- No content -->"
+
+
+@dataclass(frozen=True)
+class _Slide:
+    """A widget rendered for the rotator, and where the rotation goes after it."""
 
-def render_rotator_widget(
-    plugins: PluginManager,
-    widgets: list[str],
-    index: int,
-    n: int,
-) -> tuple[str, int, int]:
-    """Render a rotator widget.
+    html: str
+    next_index: int
+    next_n: int
 
-    Skips widgets that don't have any content to display.
 
-    Returns (widget HTML, next index, next n).
+class Rotator:
+    """Rotates through widgets, showing one at a time.
+
+    Each rotation is pushed to browsers as a `rotator.refresh` server-sent event, and
+    the next slide is rendered while the current one is showing. Widgets that don't
+    have any content to display are skipped, without rendering them if their latest
+    update already showed that they're empty.
     """
-    for _ in range(len(widgets)):
-        widget_name = widgets[index]
-        html = plugins.render_widget(widget_name, n).strip()
 
-        if index + 1 == len(widgets):
-            next_index = 0
-            next_n = n + 1  # Increment n whenever we loop through all widgets.
-        else:
-            next_index = index + 1
-            next_n = n
+    EVENT_NAME = "rotator.refresh"
+
+    def __init__(
+        self,
+        plugins: PluginManager,
+        event_bus: EventBus,
+        widgets: list[str],
+        interval: float = 30,
+    ) -> None:
+        self._plugins = plugins
+        self._event_bus = event_bus
+        self._widgets = widgets
+        self._interval = interval
+        self._task: asyncio.Task | None = None
+        self._started = False
+        self.html = NO_CONTENT
+        """The HTML of the current slide."""
+
+    def start(self) -> None:
+        self._started = True
+        if self._widgets and not self._task:
+            self._task = asyncio.create_task(self._rotate(), name="rotator")
+
+    def update(self, widgets: list[str], interval: float) -> None:
+        """Change the widgets to rotate through, such as after a layout change.
+
+        The change applies from the next rotation.
+        """
+        self._widgets = widgets
+        self._interval = interval
+        if self._started:
+            self.start()
+
+    async def shutdown(self) -> None:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _rotate(self) -> None:
+        slide = await self._find_slide(0, 0)
+        while True:
+            self.html = slide.html
+            await self._event_bus.post(Event(name=self.EVENT_NAME, data=slide.html))
+            # Get the next slide ready while this one is showing...
+            index, n = slide.next_index, slide.next_n
+            await self._find_slide(index, n)
+            await asyncio.sleep(self._interval)
+            # ...then find it again, in case its widget has been updated since
+            # (otherwise the render is cached).
+            slide = await self._find_slide(index, n)
+
+    async def _find_slide(self, index: int, n: int) -> _Slide:
+        """Find the next widget with content, starting at `index`.
+
+        `n` is the number of times the rotation has looped through all widgets, which
+        is passed to the widget being rendered so it can loop through its own list of
+        content, if any.
+        """
+        if self._widgets:
+            index %= len(self._widgets)  # In case widgets were removed.
+        next_index, next_n = index, n
+        for _ in range(len(self._widgets)):
+            widget_name = self._widgets[index]
+            # Skip rendering a widget that's known to be empty.
+            html = ""
+            if self._plugins.widget_has_content(widget_name) is not False:
+                html = await self._render(widget_name, n)
+
+            if index + 1 == len(self._widgets):
+                next_index = 0
+                next_n = n + 1  # Increment n whenever we loop through all widgets.
+            else:
+                next_index = index + 1
+                next_n = n
+
+            if html.strip():
+                return _Slide(html.strip(), next_index, next_n)
 
-        if html:
-            return html, next_index, next_n
+            index = next_index
+            n = next_n
 
-        index = next_index
-        n = next_n
+        # Nobody has anything to say...
+        return _Slide(NO_CONTENT, next_index, next_n)
 
-    # Nobody has anything to say...
-    return "<!-- No content -->", next_index, next_n
+    async def _render(self, widget_name: str, n: int) -> str:
+        try:
+            return await self._plugins.renderer.call(
+                self._plugins.render_widget, widget_name, n
+            )
+        except Exception:
+            _logger.exception("Error rendering rotator widget: %s", widget_name)
+            return ""
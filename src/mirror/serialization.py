@@ -0,0 +1,31 @@
+"""JSON encoding of plugin data, such as for the plugin database and worker updates."""
+
+import json
+from datetime import datetime
+
+
+class ExtendedEncoder(json.JSONEncoder):
+    """JSON encoder that handles additional object types."""
+
+    def default(self, o: object) -> object:
+        if hasattr(o, "isoformat"):
+            return {"_dt_": o.isoformat()}
+
+        return json.JSONEncoder.default(self, o)
+
+
+class ExtendedDecoder(json.JSONDecoder):
+    """JSON decoder that handles additional object types."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        kwargs["object_hook"] = self._object_hook
+        super().__init__(*args, **kwargs)
+
+    @staticmethod
+    def _object_hook(obj: dict) -> object:
+        if "_dt_" in obj:
+            try:
+                return datetime.fromisoformat(obj["_dt_"])
+            except ValueError:
+                pass
+        return obj
@@ -0,0 +1,84 @@
+"""Compression of server-sent event streams."""
+
+import asyncio
+import zlib
+from collections.abc import Iterable
+
+from sse_starlette.sse import EventSourceResponse
+from starlette.types import Message, Receive, Scope, Send
+
+# Supported content encodings and their zlib window bits.
+_ENCODINGS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS,
+}
+
+
+def acceptable_encodings(accept_encoding: str, supported: Iterable[str]) -> list[str]:
+    """Get the supported content encodings an Accept-Encoding header allows.
+
+    They're in order of the client's preference (its q values), then the order of
+    `supported`. An encoding with q=0 is refused, as is one the header doesn't
+    mention, unless "*" allows it.
+    """
+    qualities: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    wildcard = qualities.get("*", 0.0)
+    ranked = [(qualities.get(encoding, wildcard), encoding) for encoding in supported]
+    # The sort is stable, so ties keep the server's order.
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return [encoding for quality, encoding in ranked if quality > 0]
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Choose a supported content encoding given an Accept-Encoding header.
+
+    Returns None if the client doesn't accept any supported encoding.
+    """
+    return next(iter(acceptable_encodings(accept_encoding, _ENCODINGS)), None)
+
+
+class CompressedEventSourceResponse(EventSourceResponse):
+    """An SSE response compressed with one streaming compressor per connection.
+
+    Since the compressor lives as long as the connection, markup repeated from
+    earlier events compresses against them. The compressor is flushed after each
+    message so that the client gets every event (and ping) right away.
+    """
+
+    def __init__(self, *args, encoding: str, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.headers["Content-Encoding"] = encoding
+        self.headers["Vary"] = "Accept-Encoding"
+        self._compressor = zlib.compressobj(wbits=_ENCODINGS[encoding])
+        self._compress_lock = asyncio.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async def compressed_send(message: Message) -> None:
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            # Events and pings are sent from different tasks; keep their compressed
+            # output in the same order it was produced.
+            async with self._compress_lock:
+                body = self._compressor.compress(message.get("body", b""))
+                if message.get("more_body", False):
+                    body += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+                else:
+                    body += self._compressor.flush()
+                await send({**message, "body": body})
+
+        await super().__call__(scope, receive, compressed_send)
@@ -0,0 +1,27 @@
+"""Production mode for Jinja template environments."""
+
+import logging
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemBytecodeCache
+
+_logger = logging.getLogger(__name__)
+
+
+def precompile(env: Environment, cache_dir: Path) -> None:
+    """Compile an environment's HTML templates now rather than on first render.
+
+    Compiled templates are also saved to `cache_dir`, so that after a restart they are
+    loaded rather than compiled again (a cached template is recompiled if its source
+    changes). Template files are no longer checked for changes while running.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    env.bytecode_cache = FileSystemBytecodeCache(str(cache_dir))
+    env.auto_reload = False
+    # Only top-level templates; subdirectories (such as static) aren't templates.
+    names = env.list_templates(
+        filter_func=lambda name: "/" not in name and name.endswith(".html")
+    )
+    for name in names:
+        env.get_template(name)
+    _logger.debug("Precompiled %d templates to %s", len(names), cache_dir)
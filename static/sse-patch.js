@@ -0,0 +1,65 @@
+// Apply widget patch events from the server (see Patch in event_bus.py).
+//
+// A patch replaces part of the HTML most recently received for a widget. The
+// patched HTML is dispatched as the widget's usual refresh event, so htmx swaps
+// it in just like a full refresh.
+(function() {
+    const latest = {};  // Most recent HTML, by refresh event name.
+    const sources = new WeakSet();
+
+    function refresh(source, name, html) {
+        source.dispatchEvent(new MessageEvent(name, { data: html }));
+    }
+
+    function fetchWidget(source, name, widget) {
+        const base = latest[name];
+        fetch('/widgets/' + widget)
+            .then(function(response) {
+                // Don't swap an error message in for the widget.
+                return response.ok ? response.text() : null;
+            })
+            .then(function(html) {
+                // Drop the result if a newer refresh arrived while fetching.
+                if (html !== null && latest[name] === base) {
+                    refresh(source, name, html);
+                }
+            });
+    }
+
+    function listen(source, elt) {
+        const name = elt.getAttribute('sse-swap');  // For example, weather.refresh
+        const widget = name.slice(0, name.lastIndexOf('.'));
+
+        source.addEventListener(name, function(event) {
+            latest[name] = event.data;
+        });
+
+        source.addEventListener(widget + '.patch', function(event) {
+            const patch = JSON.parse(event.data);
+            const base = latest[name];
+            if (base === undefined) {
+                fetchWidget(source, name, widget);
+                return;
+            }
+            const html = base.slice(0, patch.start) + patch.text +
+                base.slice(base.length - patch.end);
+            if (html.length !== patch.length) {
+                fetchWidget(source, name, widget);
+                return;
+            }
+            refresh(source, name, html);
+        });
+    }
+
+    document.addEventListener('htmx:sseOpen', function(evt) {
+        // Also fires when the browser reconnects the same source.
+        const source = evt.detail.source;
+        if (sources.has(source)) {
+            return;
+        }
+        sources.add(source);
+        evt.target.querySelectorAll('[sse-swap]').forEach(function(elt) {
+            listen(source, elt);
+        });
+    });
+})();
@@ -0,0 +1,179 @@
+import gzip
+from pathlib import Path
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from mirror.assets import CACHE_CONTROL, AssetPipeline, ImmutableStaticFiles
+
+
+def make_assets(tmp_path: Path) -> AssetPipeline:
+    source_dir = tmp_path / "static"
+    (source_dir / "fonts").mkdir(parents=True)
+    (source_dir / "main.css").write_text(
+        "@import url('fonts/font.css');\nbody { color: white; }\n" * 10
+    )
+    (source_dir / "fonts" / "font.css").write_text(
+        "src: url('./Font.ttf?#iefix') format('truetype'), url(data:font/woff2;x);"
+    )
+    (source_dir / "fonts" / "Font.ttf").write_bytes(b"font data")
+    assets = AssetPipeline(tmp_path / "cache")
+    assets.add("static", source_dir)
+    return assets
+
+
+def test_fingerprinted_copies(tmp_path: Path) -> None:
+    assets = make_assets(tmp_path)
+    font_url = assets.url("static", "fonts/Font.ttf")
+    font_css_url = assets.url("static", "fonts/font.css")
+    main_url = assets.url("static", "main.css")
+    assert font_url
+    assert font_css_url
+    assert main_url
+    assert font_url.startswith("/assets/static/fonts/Font.")
+
+    # Stylesheets refer to the copies.
+    cache_dir = assets.cache_dir / "static"
+    font_css = (cache_dir / font_css_url.removeprefix("/assets/static/")).read_text()
+    font_name = font_url.rpartition("/")[2]
+    assert f"url('./{font_name}?#iefix')" in font_css
+    assert "url(data:font/woff2;x)" in font_css
+    main_path = cache_dir / main_url.removeprefix("/assets/static/")
+    assert f"url('{font_css_url.removeprefix('/assets/static/')}')" in (
+        main_path.read_text()
+    )
+    assert gzip.decompress(Path(f"{main_path}.gz").read_bytes()) == (
+        main_path.read_bytes()
+    )
+
+
+def test_changed_asset_replaces_copy(tmp_path: Path) -> None:
+    assets = make_assets(tmp_path)
+    old_url = assets.url("static", "fonts/Font.ttf")
+    (tmp_path / "static" / "fonts" / "Font.ttf").write_bytes(b"new font data")
+    assets.add("static", tmp_path / "static")
+    new_url = assets.url("static", "fonts/Font.ttf")
+    assert new_url
+    assert new_url != old_url
+    fonts = [path.name for path in (assets.cache_dir / "static" / "fonts").iterdir()]
+    assert [name for name in fonts if name.startswith("Font.")] == [
+        new_url.rpartition("/")[2]
+    ]
+
+
+def test_immutable_static_files(tmp_path: Path) -> None:
+    assets = make_assets(tmp_path)
+    app = Starlette(
+        routes=[Mount("/assets", ImmutableStaticFiles(directory=assets.cache_dir))]
+    )
+    client = TestClient(app)
+    url = assets.url("static", "main.css")
+    assert url
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["cache-control"] == CACHE_CONTROL
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/css")
+    assert "@import" in response.text
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["content-encoding"] == "br"
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip, br;q=0"})
+    assert response.headers["content-encoding"] == "gzip"
+
+    response = client.get(url, headers={"Accept-Encoding": "identity"})
+    assert response.headers["cache-control"] == CACHE_CONTROL
+    assert "content-encoding" not in response.headers
+
+    response = client.get("/assets/static/missing.css")
+    assert response.status_code == 404  # noqa: PLR2004
+    assert "cache-control" not in response.headers
+
+
+def test_circular_css_references(tmp_path: Path) -> None:
+    source_dir = tmp_path / "static"
+    source_dir.mkdir()
+    (source_dir / "a.css").write_text("@import url('b.css');")
+    (source_dir / "b.css").write_text("@import url('a.css');")
+    assets = AssetPipeline(tmp_path / "cache")
+    assets.add("static", source_dir)
+
+    a_url = assets.url("static", "a.css")
+    b_url = assets.url("static", "b.css")
+    assert a_url
+    assert b_url
+    a_css = (assets.cache_dir / a_url.removeprefix("/assets/")).read_text()
+    b_css = (assets.cache_dir / b_url.removeprefix("/assets/")).read_text()
+    assert a_css == f"@import url('{b_url.rpartition('/')[2]}');"
+    assert b_css == "@import url('a.css');"
+
+
+def test_replacements(tmp_path: Path) -> None:
+    source_dir = tmp_path / "static"
+    source_dir.mkdir()
+    (source_dir / "font.css").write_text("src: url('Font.ttf');")
+    (source_dir / "Font.ttf").write_bytes(b"font data")
+    (tmp_path / "subset.css").write_text("src: url('Font.latin.woff2');")
+    (tmp_path / "Font.latin.woff2").write_bytes(b"subset font data")
+    assets = AssetPipeline(tmp_path / "cache")
+    assets.add(
+        "static",
+        source_dir,
+        {
+            "font.css": tmp_path / "subset.css",
+            "Font.latin.woff2": tmp_path / "Font.latin.woff2",
+        },
+    )
+
+    css_url = assets.url("static", "font.css")
+    woff2_url = assets.url("static", "Font.latin.woff2")
+    assert css_url
+    assert woff2_url
+    css = (assets.cache_dir / css_url.removeprefix("/assets/")).read_text()
+    assert css == f"src: url('{woff2_url.rpartition('/')[2]}');"
+
+
+def test_bundle(tmp_path: Path) -> None:
+    assets = make_assets(tmp_path)
+    plugin_dir = tmp_path / "plugin"
+    plugin_dir.mkdir()
+    (plugin_dir / "a.js").write_text("function a() { return 1 }")
+    (plugin_dir / "b.js").write_text("(function () { a(); })();")
+    (plugin_dir / "plugin.css").write_text("#plugin { background: url(icon.svg); }")
+    (plugin_dir / "icon.svg").write_text("<svg></svg>")
+    assets.add("plugin", plugin_dir)
+    assets.bundle(
+        {
+            "plugins.js": [("plugin", "a.js"), ("plugin", "b.js")],
+            "plugins.css": [("static", "fonts/font.css"), ("plugin", "plugin.css")],
+            "empty.js": [],
+        }
+    )
+
+    js_url = assets.url(AssetPipeline.BUNDLES, "plugins.js")
+    css_url = assets.url(AssetPipeline.BUNDLES, "plugins.css")
+    assert js_url
+    assert css_url
+    assert assets.url(AssetPipeline.BUNDLES, "empty.js") is None
+    js = (assets.cache_dir / js_url.removeprefix("/assets/")).read_text()
+    assert js == "function a(){return 1};(function(){a();})();"
+    css = (assets.cache_dir / css_url.removeprefix("/assets/")).read_text()
+    # References are to the fingerprinted copies, from wherever the bundle is.
+    assert f"url('{assets.url('static', 'fonts/Font.ttf')}?#iefix')" in css
+    assert f"url({assets.url('plugin', 'icon.svg')})" in css
+    assert "url(data:font/woff2;x)" in css
+    assert "#plugin{background:url(" in css
+
+    # A changed bundle replaces the old one.
+    (plugin_dir / "b.js").write_text("a();")
+    assets.add("plugin", plugin_dir)
+    assets.bundle({"plugins.js": [("plugin", "a.js"), ("plugin", "b.js")]})
+    new_js_url = assets.url(AssetPipeline.BUNDLES, "plugins.js")
+    assert new_js_url
+    assert new_js_url != js_url
+    bundles = [path.name for path in (assets.cache_dir / "bundles").iterdir()]
+    assert [name for name in bundles if name.endswith(".js")] == [
+        new_js_url.rpartition("/")[2]
+    ]
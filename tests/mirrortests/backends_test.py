@@ -0,0 +1,105 @@
+import asyncio
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from mirror.backends import UnixSocketBackend
+from mirror.plugin_manager import PluginNotFoundError
+from mirrortests.doubles.plugin_context import PluginContext
+
+
+class FakePluginManager:
+    def __init__(self) -> None:
+        self.started = False
+        self.context = PluginContext()
+
+    def startup(self) -> None:
+        self.started = True
+
+    async def shutdown(self) -> None:
+        self.started = False
+
+    def get_plugin_context(self, plugin_name: str) -> PluginContext:
+        if plugin_name == "unknown":
+            raise PluginNotFoundError(plugin_name)
+        return self.context
+
+
+async def eventually(condition: Callable[[], bool]) -> None:
+    async with asyncio.timeout(5):
+        while not condition():  # noqa: ASYNC110
+            await asyncio.sleep(0.01)
+
+
+async def test_one_worker_runs_plugins_and_others_follow(tmp_path: Path) -> None:
+    path = tmp_path / "mirror.sock"
+    leader, follower = UnixSocketBackend(path), UnixSocketBackend(path)
+    leader_plugins, follower_plugins = FakePluginManager(), FakePluginManager()
+
+    await leader.start(leader_plugins)
+    now = datetime.now().astimezone()
+    await leader.publish("clock", None, {"time": now})
+    await follower.start(follower_plugins)
+    assert leader_plugins.started
+    assert not follower_plugins.started
+
+    # The follower catches up, then gets later updates as they happen.
+    await eventually(lambda: len(follower_plugins.context.updates) == 1)
+    await leader.publish("weather", "forecast", {"days": [1, 2]})
+    await eventually(lambda: len(follower_plugins.context.updates) == 2)  # noqa: PLR2004
+    updates = follower_plugins.context.updates
+    assert updates[0].data == {"time": now}
+    assert updates[1].widget_name == "forecast"
+    assert updates[1].data == {"days": [1, 2]}
+
+    # When the leader goes away, the follower takes over.
+    await leader.shutdown(leader_plugins)
+    await eventually(lambda: follower_plugins.started)
+    await follower.shutdown(follower_plugins)
+
+
+async def test_unserializable_update_is_not_published(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    path = tmp_path / "mirror.sock"
+    leader, follower = UnixSocketBackend(path), UnixSocketBackend(path)
+    leader_plugins, follower_plugins = FakePluginManager(), FakePluginManager()
+    await leader.start(leader_plugins)
+    await follower.start(follower_plugins)
+
+    await leader.publish("clock", None, {"times": {1, 2}})
+    await leader.publish("clock", None, {"time": 3})
+    await eventually(lambda: len(follower_plugins.context.updates) == 1)
+    assert follower_plugins.context.update.data == {"time": 3}
+    assert "can't be published" in caplog.text
+
+    await follower.shutdown(follower_plugins)
+    await leader.shutdown(leader_plugins)
+
+
+async def test_follower_survives_bad_updates(
+    tmp_path: Path, caplog: pytest.LogCaptureFixture
+) -> None:
+    path = tmp_path / "mirror.sock"
+    leader, follower = UnixSocketBackend(path), UnixSocketBackend(path)
+    follower._MAX_BUFFERED = 1024  # noqa: SLF001
+    leader_plugins, follower_plugins = FakePluginManager(), FakePluginManager()
+    await leader.start(leader_plugins)
+    await follower.start(follower_plugins)
+
+    await leader.publish("unknown", None, {"time": 1})
+    await leader.publish("clock", None, {"time": 2})
+    await eventually(lambda: len(follower_plugins.context.updates) == 1)
+    assert follower_plugins.context.update.data == {"time": 2}
+
+    # An update over the follower's size limit makes it reconnect and catch up.
+    await leader.publish("clock", "big", {"data": "x" * 2048})
+    await eventually(lambda: "reconnecting" in caplog.text)
+    await leader.publish("clock", "big", {"data": "small"})
+    await eventually(lambda: follower_plugins.context.update.data == {"data": "small"})
+
+    await leader.shutdown(leader_plugins)
+    await eventually(lambda: follower_plugins.started)
+    await follower.shutdown(follower_plugins)
@@ -0,0 +1,62 @@
+import asyncio
+import os
+from collections.abc import Mapping
+from pathlib import Path
+
+import pytest
+
+from mirror.config import Config
+
+
+def write_config(path: Path, text: str) -> None:
+    path.write_text(text)
+    # Make sure the change is seen even if the clock's resolution is coarse.
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_snapshot_is_immutable(tmp_path: Path) -> None:
+    path = tmp_path / "mirror.toml"
+    path.write_text('[layout]\nleft = ["clock"]\n')
+    config = Config(path)
+    assert config.get("layout")["left"] == ("clock",)
+    assert config.get("missing") == {}
+    with pytest.raises(TypeError):
+        config.get("layout")["left"] = ["weather"]  # type: ignore[index]
+
+
+def test_missing_file(tmp_path: Path) -> None:
+    config = Config(tmp_path / "mirror.toml")
+    assert config.snapshot == {}
+
+
+async def test_reload_notifies_subscribers(tmp_path: Path) -> None:
+    path = tmp_path / "mirror.toml"
+    path.write_text('[plugin.mail]\nhost = "a"\n')
+    config = Config(path)
+    changes: list[tuple[Mapping, Mapping]] = []
+    config.subscribe(lambda old, new: changes.append((old, new)))
+
+    async def async_subscriber(old: Mapping, new: Mapping) -> None:
+        await asyncio.sleep(0)
+        changes.append((old, new))
+
+    config.subscribe(async_subscriber)
+
+    assert not await config.reload()  # Unchanged.
+    write_config(path, '[plugin.mail]\nhost = "b"\n')
+    assert await config.reload()
+    assert config.get("plugin")["mail"]["host"] == "b"
+    [(old, new), async_change] = changes
+    assert async_change == (old, new)
+    assert old["plugin"]["mail"]["host"] == "a"
+    assert new is config.snapshot
+
+
+async def test_invalid_change_is_ignored(tmp_path: Path) -> None:
+    path = tmp_path / "mirror.toml"
+    path.write_text('[plugin.mail]\nhost = "a"\n')
+    config = Config(path)
+    write_config(path, "[plugin.mail\n")
+    assert not await config.reload()
+    assert config.get("plugin")["mail"]["host"] == "a"
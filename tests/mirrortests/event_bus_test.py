@@ -0,0 +1,296 @@
+import asyncio
+import json
+import time
+
+from mirror.event_bus import Event, EventBus, OverflowPolicy
+
+
+async def test_new_listener_gets_cached_events() -> None:
+    bus = EventBus()
+    await bus.post(Event("clock.refresh", "<p>1</p>"))
+
+    events = bus.listen_for_events()
+
+    assert b"data: <p>1</p>" in await anext(events)
+    await events.aclose()
+
+
+async def test_multi_line_data_encoded_once() -> None:
+    bus = EventBus()
+    event = Event("clock.refresh", "<p>\n1\n</p>")
+    await bus.post(event)
+
+    events1 = bus.listen_for_events()
+    events2 = bus.listen_for_events()
+    frame1 = await anext(events1)
+    frame2 = await anext(events2)
+
+    assert frame1 is frame2
+    assert frame1 == (
+        f"id: {event.seq}\r\n".encode()
+        + b"event: clock.refresh\r\ndata: <p>\r\ndata: 1\r\ndata: </p>\r\n\r\n"
+    )
+    await events1.aclose()
+    await events2.aclose()
+
+
+async def test_duplicate_event_not_resent() -> None:
+    bus = EventBus()
+    events = bus.listen_for_events()
+    await bus.post(Event("clock.refresh", "<p>1</p>"))
+    await anext(events)
+
+    await bus.post(Event("clock.refresh", "<p>1</p>"))
+    await bus.post(Event("clock.refresh", "<p>2</p>"))
+
+    assert b"data: <p>2</p>" in await anext(events)
+    await events.aclose()
+
+
+async def test_event_ids_increase() -> None:
+    bus = EventBus()
+    first = Event("clock.refresh", "<p>1</p>")
+    second = Event("weather.refresh", "<p>2</p>")
+
+    await bus.post(first)
+    await bus.post(second)
+
+    assert second.seq == first.seq + 1
+
+
+async def test_reconnect_replays_missed_events() -> None:
+    bus = EventBus()
+    clock = Event("clock.refresh", "<p>1</p>")
+    await bus.post(clock)
+    await bus.post(Event("weather.refresh", "<p>2</p>"))
+    await bus.post(Event("weather.refresh", "<p>3</p>"))
+
+    events = bus.listen_for_events(last_event_id=str(clock.seq))
+
+    assert b"data: <p>3</p>" in await anext(events)
+    await bus.shutdown()
+    assert [event async for event in events] == []
+
+
+async def test_reconnect_up_to_date() -> None:
+    bus = EventBus()
+    clock = Event("clock.refresh", "<p>1</p>")
+    await bus.post(clock)
+
+    events = bus.listen_for_events(last_event_id=str(clock.seq))
+    await bus.post(Event("weather.refresh", "<p>2</p>"))
+
+    assert b"data: <p>2</p>" in await anext(events)
+    await events.aclose()
+
+
+async def test_reconnect_older_than_replay_log() -> None:
+    bus = EventBus(replay_size=2)
+    clock = Event("clock.refresh", "<p>1</p>")
+    await bus.post(clock)
+    await bus.post(Event("weather.refresh", "<p>2</p>"))
+    await bus.post(Event("weather.refresh", "<p>3</p>"))
+
+    events = bus.listen_for_events(last_event_id=str(clock.seq - 1))
+
+    assert b"data: <p>1</p>" in await anext(events)
+    assert b"data: <p>3</p>" in await anext(events)
+    await events.aclose()
+
+
+async def test_reconnect_missed_more_than_queue_size() -> None:
+    bus = EventBus(overflow_policy=OverflowPolicy.DISCONNECT, maxsize=2)
+    clock = Event("clock.refresh", "<p>0</p>")
+    await bus.post(clock)
+    for i in range(1, 4):
+        await bus.post(Event("weather.refresh", f"<p>{i}</p>"))
+    await bus.post(Event("mail.refresh", "<p>4</p>"))
+
+    events = bus.listen_for_events(last_event_id=str(clock.seq))
+
+    # A snapshot, with every widget even though that's more than the queue size.
+    assert b"data: <p>0</p>" in await anext(events)
+    assert b"data: <p>3</p>" in await anext(events)
+    assert b"data: <p>4</p>" in await anext(events)
+    assert bus._listeners[0].dropped == 0  # noqa: SLF001
+    await events.aclose()
+
+
+async def test_coalesce_replaces_unsent_event() -> None:
+    bus = EventBus(overflow_policy=OverflowPolicy.COALESCE)
+    events = bus.listen_for_events()
+    await bus.post(Event("clock.refresh", "<p>0</p>"))
+    await anext(events)  # Subscribed now.
+
+    await bus.post(Event("weather.refresh", "<p>1</p>"))
+    await bus.post(Event("clock.refresh", "<p>2</p>"))
+    await bus.post(Event("weather.refresh", "<p>3</p>"))
+
+    assert b"data: <p>2</p>" in await anext(events)
+    assert b"data: <p>3</p>" in await anext(events)
+    assert bus._listeners[0].coalesced == 1  # noqa: SLF001
+    await events.aclose()
+
+
+async def test_drop_oldest_when_full() -> None:
+    bus = EventBus(overflow_policy=OverflowPolicy.DROP_OLDEST, maxsize=2)
+    events = bus.listen_for_events()
+    await bus.post(Event("clock.refresh", "<p>0</p>"))
+    await anext(events)
+
+    for i in range(1, 4):
+        await bus.post(Event("clock.refresh", f"<p>{i}</p>"))
+
+    assert b"data: <p>2</p>" in await anext(events)
+    assert b"data: <p>3</p>" in await anext(events)
+    assert bus._listeners[0].dropped == 1  # noqa: SLF001
+    await events.aclose()
+
+
+async def test_disconnect_when_full() -> None:
+    bus = EventBus(overflow_policy=OverflowPolicy.DISCONNECT, maxsize=2)
+    events = bus.listen_for_events()
+    await bus.post(Event("clock.refresh", "<p>0</p>"))
+    await anext(events)
+
+    for i in range(1, 4):
+        await bus.post(Event("clock.refresh", f"<p>{i}</p>"))
+
+    assert [event async for event in events] == []
+    assert not bus._listeners  # noqa: SLF001
+
+
+async def test_shutdown_ends_listeners() -> None:
+    bus = EventBus()
+    events = bus.listen_for_events()
+    await bus.post(Event("clock.refresh", "<p>0</p>"))
+    await anext(events)
+
+    await bus.shutdown()
+
+    assert [event async for event in events] == []
+
+
+async def test_listener_gets_only_subscribed_widgets() -> None:
+    bus = EventBus()
+    await bus.post(Event("weather.refresh", "<p>1</p>"))
+    await bus.post(Event("mail.refresh", "<p>2</p>"))
+
+    events = bus.listen_for_events(widgets=["weather", "calendars-agenda"])
+    assert b"data: <p>1</p>" in await anext(events)
+
+    await bus.post(Event("mail.refresh", "<p>3</p>"))
+    await bus.post(Event("calendars-agenda.refresh", "<p>4</p>"))
+
+    assert b"data: <p>4</p>" in await anext(events)
+    await events.aclose()
+    assert not bus._listeners_by_widget  # noqa: SLF001
+
+
+def apply_patch(base: str, frame: bytes) -> str:
+    """Apply a patch the way static/sse-patch.js does (for BMP-only text)."""
+    data = frame.decode().split("data: ", 1)[1].strip()
+    patch = json.loads(data)
+    html = base[: patch["start"]] + patch["text"] + base[len(base) - patch["end"] :]
+    assert len(html) == patch["length"]
+    return html
+
+
+async def test_patch_sent_when_client_has_base() -> None:
+    bus = EventBus(patches=True)
+    base = "<table>" + "<tr><td>row</td></tr>" * 20 + "<p>1,234</p></table>"
+    await bus.post(Event("activity.refresh", base))
+    events = bus.listen_for_events()
+    assert b"event: activity.refresh" in await anext(events)
+
+    updated = base.replace("1,234", "1,240")
+    await bus.post(Event("activity.refresh", updated))
+
+    frame = await anext(events)
+    assert b"event: activity.patch" in frame
+    assert apply_patch(base, frame) == updated
+    await events.aclose()
+
+
+async def test_full_event_sent_to_client_without_base() -> None:
+    bus = EventBus(patches=True)
+    base = "<p>" + "x" * 200 + "1</p>"
+    await bus.post(Event("activity.refresh", base))
+    await bus.post(Event("activity.refresh", base.replace("1", "2")))
+
+    events = bus.listen_for_events()
+
+    assert b"event: activity.refresh" in await anext(events)
+    await events.aclose()
+
+
+async def test_periodic_full_refresh() -> None:
+    bus = EventBus(patches=True, full_refresh_interval=2)
+    events = bus.listen_for_events()
+    await bus.post(Event("activity.refresh", "<p>" + "x" * 200 + "0</p>"))
+    await anext(events)
+
+    frames = []
+    for i in range(1, 5):
+        await bus.post(Event("activity.refresh", "<p>" + "x" * 200 + f"{i}</p>"))
+        frames.append(await anext(events))
+
+    kinds = [b"patch" if b".patch" in frame else b"refresh" for frame in frames]
+    assert kinds == [b"patch", b"patch", b"refresh", b"patch"]
+    await events.aclose()
+
+
+async def test_metrics() -> None:
+    bus = EventBus()
+    events = bus.listen_for_events()
+    await bus.post(Event("clock.refresh", "<p>1</p>"))
+    await bus.post(Event("clock.refresh", "<p>1</p>"))
+    await anext(events)
+    await bus.post(Event("weather.refresh", "<p>2</p>"))
+    await anext(events)  # The previous event is counted once it has been sent.
+
+    text = bus.metrics_text()
+
+    assert 'mirror_events_posted_total{event="clock.refresh"} 2' in text
+    assert 'mirror_events_deduplicated_total{event="clock.refresh"} 1' in text
+    assert 'mirror_events_delivered_total{event="clock.refresh"} 1' in text
+    assert 'mirror_listener_queue_high_water{listener="1"} 1' in text
+    assert "mirror_listeners 1" in text
+    await events.aclose()
+
+
+async def test_delivery_time_from_start_of_render() -> None:
+    bus = EventBus()
+    events = bus.listen_for_events()
+    started = time.monotonic() - 3  # Rendering took a while.
+    await bus.post(Event("clock.refresh", "<p>1</p>", started=started))
+    await anext(events)
+    await bus.post(Event("clock.refresh", "<p>2</p>"))
+    await anext(events)  # The previous event is counted once it has been sent.
+
+    text = bus.metrics_text()
+
+    assert 'mirror_event_delivery_seconds_bucket{le="2.5"} 0' in text
+    assert 'mirror_event_delivery_seconds_bucket{le="5.0"} 1' in text
+    await events.aclose()
+
+
+async def test_heartbeat_when_idle() -> None:
+    bus = EventBus(heartbeat_interval=0.01)
+    events = bus.listen_for_events()
+
+    assert await anext(events) == b": heartbeat\r\n\r\n"
+    await events.aclose()
+
+
+async def test_idle_listener_removed() -> None:
+    bus = EventBus(heartbeat_interval=0.01, idle_timeout=0.03)
+    bus.start()
+    events = bus.listen_for_events()
+    await anext(events)  # Subscribed, but never takes anything else.
+
+    await asyncio.sleep(0.1)
+
+    assert not bus._listeners  # noqa: SLF001
+    await bus.shutdown()
+    await events.aclose()
@@ -0,0 +1,108 @@
+import shutil
+from pathlib import Path
+
+from fontTools.ttLib import TTFont
+
+from mirror.fonts import (
+    FontUsage,
+    _parse_font_faces,
+    _used_faces,
+    find_usage,
+    subset_fonts,
+)
+from mirror.paths import ROOT_DIR
+
+FONT_CSS = """
+@font-face {
+    font-family: 'Montserrat';
+    src: url('Montserrat-Regular.ttf') format('truetype');
+    font-weight: normal;
+    font-style: normal;
+}
+@font-face {
+    font-family: 'Montserrat';
+    src: url('Montserrat-SemiBold.ttf') format('truetype');
+    font-weight: 600;
+    font-style: normal;
+}
+@font-face {
+    font-family: 'Montserrat';
+    src: url('Montserrat-Italic.ttf') format('truetype');
+    font-weight: normal;
+    font-style: italic;
+}
+@font-face {
+    font-family: 'Roboto';
+    src: url('Roboto-Regular.ttf') format('truetype');
+}
+"""
+
+
+def test_find_usage() -> None:
+    usage = find_usage(
+        stylesheets=[
+            FONT_CSS + "body { font-family: 'Montserrat', sans-serif; }",
+            "h1 { font-weight: bold; }",
+        ],
+        templates=["<p>Nothing special</p>"],
+    )
+    assert usage.families == {"Montserrat"}
+    assert usage.weights == {400, 700}
+    assert usage.styles == {"normal"}
+
+
+def test_find_usage_in_templates() -> None:
+    usage = find_usage(stylesheets=[], templates=["<p><b>Bold</b> and <em>i</em></p>"])
+    assert usage.weights == {400, 700}
+    assert usage.styles == {"normal", "italic"}
+
+
+def test_used_faces_are_nearest_weights() -> None:
+    faces = _parse_font_faces(FONT_CSS)
+    usage = FontUsage(
+        families=frozenset({"Montserrat"}),
+        weights=frozenset({400, 700}),
+        styles=frozenset({"normal"}),
+    )
+    assert [face.source for face in _used_faces(faces, usage)] == [
+        "Montserrat-Regular.ttf",
+        "Montserrat-SemiBold.ttf",
+    ]
+
+
+def test_unused_family_has_no_faces() -> None:
+    faces = _parse_font_faces(FONT_CSS)
+    usage = FontUsage(
+        families=frozenset({"Lato"}),
+        weights=frozenset({400}),
+        styles=frozenset({"normal"}),
+    )
+    assert _used_faces(faces, usage) == []
+
+
+def test_subset_fonts(tmp_path: Path) -> None:
+    static_dir = tmp_path / "static"
+    static_dir.mkdir()
+    source = ROOT_DIR / "static" / "fonts" / "montserrat" / "Montserrat-Regular.ttf"
+    shutil.copy(source, static_dir)
+    (static_dir / "fonts.css").write_text(FONT_CSS)
+    usage = FontUsage(
+        families=frozenset({"Montserrat"}),
+        weights=frozenset({400}),
+        styles=frozenset({"normal"}),
+    )
+
+    replacements = subset_fonts(static_dir, usage, tmp_path / "cache")
+
+    assert set(replacements) == {"fonts.css", "Montserrat-Regular.latin.woff2"}
+    css = replacements["fonts.css"].read_text()
+    assert "url('Montserrat-Regular.latin.woff2') format('woff2')" in css
+    assert "Roboto" not in css
+    woff2 = replacements["Montserrat-Regular.latin.woff2"]
+    assert woff2.stat().st_size < source.stat().st_size
+    font = TTFont(woff2)
+    assert font.flavor == "woff2"
+    code_points = font.getBestCmap().keys()
+    assert ord("A") in code_points
+    assert ord("ã") in code_points
+    assert ord("Ж") not in code_points  # Cyrillic
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from mirror.main import _flush_at_sections, reload_plugin, widget
+
+
+def test_flush_at_sections() -> None:
+    chunks = ["<head>", "<title>", "</title></head>\n<body>", "<section>", "a", "b"]
+    chunks += ["</section>", "<section>", "c", "</section>\n", "</body>"]
+    assert list(_flush_at_sections(chunks)) == [
+        "<head><title></title></head>\n<body>",
+        "<section>ab</section>",
+        "<section>c</section>\n",
+        "</body>",
+    ]
+
+
+def test_rotator_widget() -> None:
+    # The rotator's current slide, for a client that can't apply its patch.
+    app = Starlette(routes=[Route("/widgets/{widget}", endpoint=widget)])
+    app.state.rotator = SimpleNamespace(html="<p>slide</p>")
+    response = TestClient(app).get("/widgets/rotator")
+    assert response.status_code == 200  # noqa: PLR2004
+    assert response.text == "<p>slide</p>"
+
+
+def test_widget_etag() -> None:
+    app = Starlette(routes=[Route("/widgets/{widget}", endpoint=widget)])
+    app.state.rotator = SimpleNamespace(html="<p>slide</p>")
+    client = TestClient(app)
+    etag = client.get("/widgets/rotator").headers["etag"]
+
+    response = client.get("/widgets/rotator", headers={"If-None-Match": etag})
+    assert response.status_code == 304  # noqa: PLR2004
+    assert response.headers["etag"] == etag
+
+    app.state.rotator.html = "<p>next slide</p>"
+    response = client.get("/widgets/rotator", headers={"If-None-Match": etag})
+    assert response.status_code == 200  # noqa: PLR2004
+    assert response.headers["etag"] != etag
+
+
+def test_reload_plugin_only_from_loopback() -> None:
+    reloaded = []
+    app = Starlette(
+        routes=[
+            Route(
+                "/admin/plugins/{plugin}/reload",
+                endpoint=reload_plugin,
+                methods=["POST"],
+            )
+        ]
+    )
+
+    async def reload_plugin_(plugin_name: str) -> None:
+        reloaded.append(plugin_name)
+
+    app.state.plugins = SimpleNamespace(reload_plugin=reload_plugin_)
+    url = "/admin/plugins/clock/reload"
+
+    remote = TestClient(app, client=("192.168.1.20", 50000)).post(url)
+    local = TestClient(app, client=("127.0.0.1", 50000)).post(url)
+
+    assert remote.status_code == 403  # noqa: PLR2004
+    assert local.status_code == 204  # noqa: PLR2004
+    assert reloaded == ["clock"]
@@ -0,0 +1,37 @@
+from mirror.metrics import Counter, Gauge, Histogram, expose
+
+
+def test_counter() -> None:
+    counter = Counter("things_total", "Things.", "kind")
+    counter.inc("a")
+    counter.inc("a")
+    counter.inc('b"')
+
+    assert expose([counter]).splitlines() == [
+        "# HELP things_total Things.",
+        "# TYPE things_total counter",
+        'things_total{kind="a"} 2',
+        'things_total{kind="b\\""} 1',
+    ]
+
+
+def test_gauge_without_label() -> None:
+    gauge = Gauge("level", "Level.")
+    gauge.set(0.5)
+
+    assert expose([gauge]).splitlines()[-1] == "level 0.5"
+
+
+def test_histogram() -> None:
+    histogram = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(2)
+
+    assert expose([histogram]).splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 2.55",
+        "latency_seconds_count 3",
+    ]
@@ -0,0 +1,181 @@
+import asyncio
+import importlib
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from mirror import plugin_manager
+from mirror.config import Config
+from mirror.event_bus import EventBus
+from mirror.plugin import Plugin
+from mirror.plugin_manager import PluginManager
+from mirror.renderer import Renderer
+
+PLUGIN_CODE = """
+VERSION = {version}
+
+def start_plugin(context):
+    context.calls.append(("start", VERSION))
+
+def stop_plugin(context):
+    context.calls.append(("stop", VERSION))
+"""
+
+# A plugin with a task that, like one writing to its database, is still busy for a
+# moment after it's cancelled.
+TASK_PLUGIN_CODE = """
+import asyncio
+
+VERSION = 1
+_state = {}
+
+async def _refresh(context):
+    try:
+        await asyncio.sleep(60)
+    finally:
+        await asyncio.sleep(0)
+        context.calls.append(("task done", VERSION))
+
+def start_plugin(context):
+    _state["task"] = asyncio.create_task(_refresh(context))
+
+def stop_plugin(context):
+    _state["task"].cancel()
+"""
+
+# Calls to the plugin's start_plugin and stop_plugin functions, and to close its
+# context.
+CALLS: list[tuple[str, int]] = []
+
+
+class FakePluginContext:
+    def __init__(self, plugin: Plugin, *_: object) -> None:
+        self.plugin = plugin
+        self.calls = CALLS
+
+    def close(self) -> None:
+        self.calls.append(("close", self.plugin.module.VERSION))
+
+
+@pytest.fixture
+def package_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Path]:
+    """A plugin package, "reloadable", that can be changed and reloaded."""
+    package_dir = tmp_path / "reloadable"
+    package_dir.mkdir()
+    (package_dir / "__init__.py").write_text(PLUGIN_CODE.format(version=1))
+    (package_dir / "reloadable.html").write_text("v1 {{ count }}")
+    monkeypatch.syspath_prepend(tmp_path)
+    # A quick edit could otherwise load stale bytecode with the same timestamp.
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    yield package_dir
+    sys.modules.pop("reloadable", None)
+
+
+@pytest.fixture
+def plugins(
+    package_dir: Path,  # noqa: ARG001
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> PluginManager:
+    monkeypatch.setattr(
+        plugin_manager,
+        "discover_plugins",
+        lambda: [Plugin("reloadable", importlib.import_module("reloadable"))],
+    )
+    monkeypatch.setattr(plugin_manager, "PluginContext", FakePluginContext)
+    CALLS.clear()
+    return PluginManager(EventBus(), Config(tmp_path / "mirror.toml"))
+
+
+async def test_reload_plugin(plugins: PluginManager, package_dir: Path) -> None:
+    plugins.startup()
+    [plugin] = plugins
+    plugin.render({"count": 3}, None)
+    (package_dir / "__init__.py").write_text(PLUGIN_CODE.format(version=2))
+    (package_dir / "reloadable.html").write_text("v2 {{ count }}")
+
+    await plugins.reload_plugin("reloadable")
+
+    assert CALLS == [("start", 1), ("stop", 1), ("close", 1), ("start", 2)]
+    [reloaded] = plugins
+    assert reloaded is not plugin
+    assert reloaded.module.VERSION == 2  # noqa: PLR2004
+    # The widget keeps its context, and renders with the changed template.
+    assert plugins.render_widget("reloadable") == "v2 3"
+
+
+async def test_reload_plugin_with_error(
+    plugins: PluginManager, package_dir: Path
+) -> None:
+    plugins.startup()
+    [plugin] = plugins
+    (package_dir / "__init__.py").write_text("VERSION = ")
+
+    with pytest.raises(SyntaxError):
+        await plugins.reload_plugin("reloadable")
+
+    # The plugin carries on as it was.
+    assert CALLS == [("start", 1), ("stop", 1), ("close", 1), ("start", 1)]
+    assert [*plugins] == [plugin]
+    assert sys.modules["reloadable"] is plugin.module
+
+
+async def test_widgets(plugins: PluginManager, package_dir: Path) -> None:
+    (package_dir / "extra.html").write_text("extra {{ count }}")
+    await plugins.reload_plugin("reloadable")
+    [plugin] = plugins
+    plugin.render({"count": 1}, "extra")
+
+    assert plugins.has_widget("reloadable")
+    assert plugins.has_widget("reloadable-extra")
+    assert not plugins.has_widget("reloadable-missing")
+    assert plugins.render_widget("reloadable-extra") == "extra 1"
+    assert plugins.widget_has_content("reloadable-extra")
+    assert plugins.widget_has_content("reloadable-missing") is None
+    with pytest.raises(ValueError, match="Unknown widget"):
+        plugins.render_widget("reloadable-missing")
+
+
+async def test_contexts_are_cached(plugins: PluginManager) -> None:
+    plugins.startup()
+    context = plugins.get_plugin_context("reloadable")
+    assert plugins.get_plugin_context("reloadable") is context
+
+    await plugins.shutdown()
+    assert CALLS == [("start", 1), ("stop", 1), ("close", 1)]
+    assert plugins.get_plugin_context("reloadable") is not context
+
+
+async def test_unstarted_contexts_are_closed(plugins: PluginManager) -> None:
+    # Such as in a worker that only applies updates from another (see backends).
+    plugins.get_plugin_context("reloadable")
+    await plugins.shutdown()
+    assert CALLS == [("close", 1)]
+
+
+async def test_plugin_tasks_finish_before_context_closes(
+    plugins: PluginManager, package_dir: Path
+) -> None:
+    (package_dir / "__init__.py").write_text(TASK_PLUGIN_CODE)
+    await plugins.reload_plugin("reloadable")
+    plugins.startup()
+    await asyncio.sleep(0)  # Let the plugin's task start.
+
+    await plugins.shutdown()
+
+    assert CALLS == [("task done", 1), ("close", 1)]
+
+
+def test_start_rendering_widgets(plugins: PluginManager) -> None:
+    [plugin] = plugins
+    plugin.render({"count": 4}, None)
+    # Without render workers, the template is left to render widgets itself.
+    assert plugins.start_rendering_widgets(["reloadable"]) == {}
+
+    plugins.renderer = Renderer(workers=2)
+    rendered = plugins.start_rendering_widgets(["reloadable"])
+    assert "reloadable" in rendered
+    assert rendered["reloadable"] == "v1 4"
+    plugins.renderer.shutdown()
@@ -0,0 +1,74 @@
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+from mirror.plugin import Plugin, freeze_mapping
+
+
+@pytest.fixture
+def plugin(tmp_path: Path) -> Plugin:
+    (tmp_path / "steps.html").write_text(
+        "{% for person in persons %}{{ person.name }}:{{ person.steps }} "
+        "{% endfor %}n={{ n }}"
+    )
+    module = ModuleType("steps")
+    module.__path__ = [str(tmp_path)]
+    return Plugin("steps", module)
+
+
+def test_render_keeps_a_snapshot_of_the_context(plugin: Plugin) -> None:
+    data = {"persons": [{"name": "Ann", "steps": 10}]}
+    assert plugin.render(data, None) == "Ann:10 n=None"
+
+    # The plugin can keep changing its data without changing what was rendered.
+    data["persons"][0]["steps"] = 20
+    data["persons"].append({"name": "Bob", "steps": 5})
+    assert plugin.render(None, None, n=3) == "Ann:10 n=3"
+    assert "n" not in data
+
+
+def test_render_without_a_context(plugin: Plugin) -> None:
+    assert plugin.render(None, None, n=1) == "n=1"
+
+
+def test_render_reuses_cached_html(plugin: Plugin) -> None:
+    renders = []
+    plugin.env.globals["count"] = lambda: renders.append(1) or len(renders)
+    (plugin.path / "counted.html").write_text("{{ text }} {{ count() }}")
+
+    assert plugin.render({"text": "a"}, "counted") == "a 1"
+    assert plugin.render(None, "counted") == "a 1"
+    assert plugin.render(None, "counted", n=2) == "a 2"
+    assert plugin.render(None, "counted", n=2) == "a 2"
+
+    # A new context replaces what was cached.
+    assert plugin.render({"text": "b"}, "counted") == "b 3"
+    assert plugin.render(None, "counted", n=2) == "b 4"
+
+
+def test_has_content(plugin: Plugin) -> None:
+    assert plugin.has_content(None) is None
+    plugin.render({"persons": [{"name": "Ann", "steps": 1}]}, None)
+    assert plugin.has_content(None) is True
+
+    (plugin.path / "empty.html").write_text("{% if items %}{{ items }}{% endif %}\n")
+    plugin.render({"items": []}, "empty")
+    assert plugin.has_content("empty") is False
+    plugin.render({"items": [1]}, "empty")
+    assert plugin.has_content("empty") is True
+
+
+def test_freeze_mapping_shares_unchanged_parts() -> None:
+    data = {"persons": [{"name": "Ann"}, {"name": "Bob"}], "tags": {"a"}, "n": 1}
+    first = freeze_mapping(data)
+    assert first["tags"] == frozenset({"a"})
+    assert freeze_mapping(data, first) is first
+
+    data["persons"][1]["name"] = "Cy"
+    second = freeze_mapping(data, first)
+    assert second is not first
+    assert second["persons"][0] is first["persons"][0]
+    assert second["persons"][1]["name"] == "Cy"
+    assert first["persons"][1]["name"] == "Bob"
+    assert second["tags"] is first["tags"]
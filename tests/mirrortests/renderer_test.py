@@ -0,0 +1,58 @@
+import asyncio
+import threading
+from pathlib import Path
+from types import ModuleType
+
+from mirror.plugin import Plugin
+from mirror.renderer import Renderer
+
+
+def make_plugin(tmp_path: Path) -> Plugin:
+    (tmp_path / "thread.html").write_text("{{ text }} {{ thread() }}")
+    module = ModuleType("thread")
+    module.__path__ = [str(tmp_path)]
+    plugin = Plugin("thread", module)
+    plugin.env.globals["thread"] = lambda: threading.current_thread().name
+    return plugin
+
+
+async def test_render_on_event_loop(tmp_path: Path) -> None:
+    renderer = Renderer()
+    html = await renderer.render(make_plugin(tmp_path), {"text": "hi"}, None)
+    assert html == f"hi {threading.current_thread().name}"
+
+
+async def test_render_on_workers(tmp_path: Path) -> None:
+    renderer = Renderer(workers=2)
+    html = await renderer.render(make_plugin(tmp_path), {"text": "hi"}, None)
+    renderer.shutdown()
+    assert html.startswith("hi render_")
+
+
+async def test_in_order() -> None:
+    renderer = Renderer(workers=2)
+    finished = []
+
+    async def update(name: str, delay: float) -> None:
+        async with renderer.in_order("widget"):
+            await asyncio.sleep(delay)
+            finished.append(name)
+
+    await asyncio.gather(update("first", 0.05), update("second", 0))
+    renderer.shutdown()
+    assert finished == ["first", "second"]
+
+
+async def test_call_concurrently() -> None:
+    renderer = Renderer(workers=2)
+    barrier = threading.Barrier(2, timeout=5)
+
+    def render(text: str) -> str:
+        barrier.wait()  # Both renders must be running at once to get past here.
+        return text
+
+    results = await asyncio.gather(
+        renderer.call(render, "a"), renderer.call(render, "b")
+    )
+    renderer.shutdown()
+    assert results == ["a", "b"]
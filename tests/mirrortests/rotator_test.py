@@ -0,0 +1,81 @@
+import asyncio
+
+from mirror.event_bus import Event
+from mirror.renderer import Renderer
+from mirror.rotator import NO_CONTENT, Rotator
+
+
+class FakePluginManager:
+    def __init__(self, widgets: dict[str, list[str]]) -> None:
+        self.widgets = widgets
+        self.renderer = Renderer()
+        self.rendered: list[str] = []
+
+    def widget_has_content(self, widget_name: str) -> bool | None:
+        # Known for widgets that have been rendered.
+        return bool(self.widgets[widget_name]) if widget_name in self.rendered else None
+
+    def render_widget(self, widget_name: str, n: int | None = None) -> str:
+        self.rendered.append(widget_name)
+        items = self.widgets[widget_name]
+        return f"  {items[(n or 0) % len(items)]}\n" if items else "\n"
+
+
+class FakeEventBus:
+    def __init__(self) -> None:
+        self.events: list[Event] = []
+        self.posted = asyncio.Condition()
+
+    async def post(self, event: Event) -> None:
+        async with self.posted:
+            self.events.append(event)
+            self.posted.notify_all()
+
+    async def wait_for(self, count: int) -> None:
+        async with asyncio.timeout(5), self.posted:
+            await self.posted.wait_for(lambda: len(self.events) >= count)
+
+
+async def run_rotator(plugins: FakePluginManager, count: int) -> list[str]:
+    event_bus = FakeEventBus()
+    rotator = Rotator(plugins, event_bus, [*plugins.widgets], 0.001)
+    rotator.start()
+    await event_bus.wait_for(count)
+    await rotator.shutdown()
+    assert {event.name for event in event_bus.events} == {"rotator.refresh"}
+    return [event.data for event in event_bus.events[:count]]
+
+
+async def test_rotation_skips_widgets_without_content() -> None:
+    widgets = {"mail": ["m1", "m2"], "empty": [], "positivity": ["p1", "p2", "p3"]}
+    plugins = FakePluginManager(widgets)
+    slides = await run_rotator(plugins, 6)
+    assert slides == ["m1", "p1", "m2", "p2", "m1", "p3"]
+    # Once known to be empty, a widget isn't rendered again.
+    assert plugins.rendered.count("empty") == 1
+
+
+async def test_rotation_without_content() -> None:
+    slides = await run_rotator(FakePluginManager({"empty": []}), 2)
+    assert slides == [NO_CONTENT, NO_CONTENT]
+
+
+async def test_rotation_without_widgets() -> None:
+    rotator = Rotator(FakePluginManager({}), FakeEventBus(), [])
+    rotator.start()
+    await rotator.shutdown()
+    assert rotator.html == NO_CONTENT
+
+
+async def test_rotation_update() -> None:
+    plugins = FakePluginManager({"mail": ["m1"], "positivity": ["p1"]})
+    event_bus = FakeEventBus()
+    rotator = Rotator(plugins, event_bus, [], 0.001)
+    rotator.start()
+    rotator.update(["mail", "positivity"], 0.001)
+    await event_bus.wait_for(2)
+    rotator.update(["positivity"], 0.001)
+    count = len(event_bus.events)
+    await event_bus.wait_for(count + 2)
+    await rotator.shutdown()
+    assert {event.data for event in event_bus.events[count + 1 :]} == {"p1"}
@@ -0,0 +1,47 @@
+import asyncio
+import zlib
+from collections.abc import AsyncGenerator
+
+from mirror.sse_compression import CompressedEventSourceResponse, choose_encoding
+
+
+def test_choose_encoding() -> None:
+    assert choose_encoding("gzip, deflate, br") == "gzip"
+    assert choose_encoding("deflate;q=0.5") == "deflate"
+    assert choose_encoding("br") is None
+    assert choose_encoding("") is None
+
+
+def test_choose_encoding_by_quality() -> None:
+    assert choose_encoding("gzip;q=0, deflate") == "deflate"
+    assert choose_encoding("gzip;q=0.5, deflate") == "deflate"
+    assert choose_encoding("deflate;q=0") is None
+    assert choose_encoding("*;q=0.5, gzip;q=0") == "deflate"
+    assert choose_encoding("identity;q=1, *;q=0") is None
+
+
+async def test_each_event_decompresses_on_arrival() -> None:
+    frames = [b"event: a\r\ndata: <p>hello</p>\r\n\r\n"] * 3
+
+    async def events() -> AsyncGenerator:
+        for frame in frames:
+            yield frame
+
+    async def receive() -> dict:
+        await asyncio.Event().wait()
+        return {}
+
+    sent = []
+
+    async def send(message: dict) -> None:
+        sent.append(message)
+
+    response = CompressedEventSourceResponse(events(), encoding="gzip", ping=0)
+    await response({"type": "http"}, receive, send)
+
+    assert (b"content-encoding", b"gzip") in sent[0]["headers"]
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    bodies = [message["body"] for message in sent[1:4]]
+    assert [decompressor.decompress(body) for body in bodies] == frames
+    # Repeated markup compresses against the earlier frames.
+    assert len(bodies[2]) < len(bodies[0])
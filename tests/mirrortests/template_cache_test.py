@@ -0,0 +1,21 @@
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader
+
+from mirror.template_cache import precompile
+
+
+def test_precompile(tmp_path: Path) -> None:
+    template_dir = tmp_path / "templates"
+    (template_dir / "static").mkdir(parents=True)
+    (template_dir / "widget.html").write_text("<p>{{ text }}</p>")
+    (template_dir / "static" / "page.html").write_text("{{ not a template")
+    cache_dir = tmp_path / "cache"
+    env = Environment(loader=FileSystemLoader(template_dir))  # noqa: S701
+
+    precompile(env, cache_dir)
+
+    assert len(list(cache_dir.iterdir())) == 1
+    # Once compiled, templates aren't reloaded from disk.
+    (template_dir / "widget.html").write_text("<div>{{ text }}</div>")
+    assert env.get_template("widget.html").render(text="hi") == "<p>hi</p>"